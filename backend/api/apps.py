@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        from . import (authentication, cache, images,  # noqa: F401
+                       pantry, shopping_list)
@@ -0,0 +1,86 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.permissions import SAFE_METHODS
+
+from users.models import CustomUser
+from .cache import cache_is_shared
+
+TOKEN_KEY = 'api:token:{}'
+COUNTER_KEY = 'api:token-cache:{}'
+
+
+def token_key(key):
+    return TOKEN_KEY.format(hashlib.sha256(key.encode()).hexdigest())
+
+
+def count(name):
+    key = COUNTER_KEY.format(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def stats():
+    counters = cache.get_many(
+        [COUNTER_KEY.format('hits'), COUNTER_KEY.format('misses')])
+    return {
+        'hits': counters.get(COUNTER_KEY.format('hits'), 0),
+        'misses': counters.get(COUNTER_KEY.format('misses'), 0),
+    }
+
+
+# Keeps the token and its user in the cache for TOKEN_CACHE_TIMEOUT
+# seconds. Deleting the token (djoser logout) or saving the user
+# (password change, deactivation) drops the entry, which only reaches
+# every worker through a shared cache, so with a per-process one the
+# token is always read from the database. Unsafe requests read it from
+# the database too: they may save request.user, and a cached copy would
+# write back stale fields such as is_active.
+class CachedTokenAuthentication(TokenAuthentication):
+    use_cache = False
+
+    def authenticate(self, request):
+        self.use_cache = (
+            request.method in SAFE_METHODS and cache_is_shared())
+        return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        if not self.use_cache:
+            return super().authenticate_credentials(key)
+        cache_key = token_key(key)
+        credentials = cache.get(cache_key)
+        if credentials is not None:
+            count('hits')
+            return credentials
+        count('misses')
+        credentials = super().authenticate_credentials(key)
+        cache.set(cache_key, credentials, settings.TOKEN_CACHE_TIMEOUT)
+        return credentials
+
+
+def forget_tokens(keys):
+    keys = list(keys)
+    transaction.on_commit(
+        lambda: cache.delete_many([token_key(key) for key in keys]))
+
+
+@receiver(post_delete, sender=Token)
+def forget_token(instance, **kwargs):
+    forget_tokens([instance.key])
+
+
+@receiver(post_save, sender=CustomUser)
+def forget_user_tokens(instance, created, update_fields=None, **kwargs):
+    # Logging in only touches last_login.
+    if not created and update_fields != frozenset(('last_login', )):
+        forget_tokens(Token.objects.filter(user=instance).values_list(
+            'key', flat=True))
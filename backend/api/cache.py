@@ -0,0 +1,150 @@
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from foodgram_app.models import (Favorite, Follow, Ingredient, Purchase,
+                                 Recipe, Tag)
+from .replicas import primary
+
+NAMESPACE_KEY = 'api:namespace:{}'
+RESPONSE_KEY = 'api:response:{}'
+# Backends that keep their entries inside one process.
+PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def cache_is_shared():
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_CACHES
+
+
+def recipe_namespace(pk):
+    return f'recipe:{pk}'
+
+
+def user_namespace(pk):
+    return f'user:{pk}'
+
+
+def namespace_versions(names):
+    keys = {NAMESPACE_KEY.format(name): name for name in names}
+    versions = cache.get_many(keys)
+    missing = {
+        key: (uuid.uuid4().hex, time.time())
+        for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_namespaces(*names):
+    stamp = time.time()
+    cache.set_many({
+        NAMESPACE_KEY.format(name): (uuid.uuid4().hex, stamp)
+        for name in names}, None)
+
+
+def response_key(request, versions):
+    params = sorted(
+        (name, sorted(values))
+        for name, values in request.query_params.lists())
+    raw = repr((request.build_absolute_uri(request.path), params,
+                request.accepted_media_type, versions))
+    return RESPONSE_KEY.format(hashlib.md5(raw.encode()).hexdigest())
+
+
+def render(view, response):
+    response.accepted_renderer = view.request.accepted_renderer
+    response.accepted_media_type = view.request.accepted_media_type
+    response.renderer_context = view.get_renderer_context()
+    return response.render()
+
+
+class CachedReadMixin:
+    # Anonymous list/retrieve responses are stored under a key built
+    # from the normalized query and the versions of the namespaces the
+    # view depends on; bumping a namespace orphans all of its entries.
+    cache_namespaces = ()
+
+    def get_cache_namespaces(self):
+        return self.cache_namespaces
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(super().retrieve, request, *args, **kwargs)
+
+    def cached(self, handler, request, *args, **kwargs):
+        if (request.user.is_authenticated
+                or request.accepted_renderer.format != 'json'):
+            return handler(request, *args, **kwargs)
+        versions = namespace_versions(self.get_cache_namespaces())
+        key = response_key(request, versions)
+        entry = cache.get(key)
+        if entry is None:
+            with primary():
+                response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            render(self, response)
+            entry = {
+                'content': response.content,
+                'content_type': response['Content-Type'],
+                'etag': quote_etag(
+                    hashlib.md5(response.content).hexdigest()),
+                'last_modified': int(max(
+                    stamp for _, stamp in versions)),
+            }
+            cache.set(key, entry, settings.RESPONSE_CACHE_TIMEOUT)
+        else:
+            response = HttpResponse(
+                entry['content'], content_type=entry['content_type'])
+        response['ETag'] = entry['etag']
+        response['Last-Modified'] = http_date(entry['last_modified'])
+        patch_vary_headers(response, ('Authorization', ))
+        return get_conditional_response(
+            request, etag=entry['etag'],
+            last_modified=entry['last_modified'], response=response)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe(instance, **kwargs):
+    namespace = recipe_namespace(instance.pk)
+    transaction.on_commit(
+        lambda: bump_namespaces('recipe-list', namespace))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags(**kwargs):
+    transaction.on_commit(lambda: bump_namespaces('tags'))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    transaction.on_commit(lambda: bump_namespaces('ingredients'))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=Purchase)
+@receiver(post_delete, sender=Purchase)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_user(instance, **kwargs):
+    namespace = user_namespace(instance.user_id)
+    transaction.on_commit(lambda: bump_namespaces(namespace))
@@ -0,0 +1,145 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, Q
+
+from foodgram_app.models import FeedEntry, Follow, Recipe
+
+logger = logging.getLogger(__name__)
+
+CELEBRITIES_KEY = 'api:feed:celebrities'
+# The set of the last computation, to notice authors who have left it.
+KNOWN_CELEBRITIES_KEY = 'api:feed:celebrities:known'
+CELEBRITIES_TIMEOUT = 300
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.FEED_WORKERS, thread_name_prefix='feed')
+
+
+# Every user has a timeline of the recipes of the authors they follow.
+# A new recipe is copied into the timelines of its author's followers in
+# the background, FEED_FANOUT_BATCH_SIZE followers at a time. Authors with
+# more than FEED_FANOUT_LIMIT followers are not fanned out: their recipes
+# are merged into the feed when it is read. Once an author drops below
+# the limit, their latest FEED_BACKFILL_SIZE recipes are fanned out again
+# so that what was only merged on read stays in the feed.
+def celebrities():
+    authors = cache.get(CELEBRITIES_KEY)
+    if authors is None:
+        authors = set(Follow.objects.order_by().values('author').annotate(
+            followers=Count('id')).filter(
+            followers__gt=settings.FEED_FANOUT_LIMIT).values_list(
+            'author', flat=True))
+        cache.set(CELEBRITIES_KEY, authors, CELEBRITIES_TIMEOUT)
+        known = cache.get(KNOWN_CELEBRITIES_KEY, set())
+        cache.set(KNOWN_CELEBRITIES_KEY, authors, None)
+        for author_id in known - authors:
+            executor.submit(catch_up, author_id)
+    return authors
+
+
+def is_celebrity(author_id):
+    followers = Follow.objects.filter(author_id=author_id)
+    return followers[:settings.FEED_FANOUT_LIMIT + 1].count() > (
+        settings.FEED_FANOUT_LIMIT)
+
+
+def deliver(author_id, recipes):
+    followers = Follow.objects.filter(
+        author_id=author_id).order_by('user_id').values_list(
+        'user_id', flat=True)
+    last = 0
+    while True:
+        batch = list(followers.filter(
+            user_id__gt=last)[:settings.FEED_FANOUT_BATCH_SIZE])
+        if not batch:
+            break
+        FeedEntry.objects.bulk_create(
+            (FeedEntry(user_id=user_id, recipe_id=pk, author_id=author_id,
+                       pub_date=pub_date)
+             for user_id in batch for pk, pub_date in recipes),
+            ignore_conflicts=True)
+        last = batch[-1]
+
+
+def fan_out(pk):
+    try:
+        recipe = Recipe.objects.filter(pk=pk).values(
+            'author_id', 'pub_date').first()
+        if recipe is None:
+            return
+        if is_celebrity(recipe['author_id']):
+            # Readers may still think the author is an ordinary one.
+            cache.delete(CELEBRITIES_KEY)
+            return
+        deliver(recipe['author_id'], [(pk, recipe['pub_date'])])
+    except Exception:
+        logger.exception('Не удалось разослать рецепт %s подписчикам', pk)
+    finally:
+        connection.close()
+
+
+def catch_up(author_id):
+    try:
+        deliver(author_id, list(Recipe.objects.filter(
+            author_id=author_id).order_by('-pub_date', '-id').values_list(
+            'id', 'pub_date')[:settings.FEED_BACKFILL_SIZE]))
+    except Exception:
+        logger.exception(
+            'Не удалось вернуть рецепты автора %s в ленты', author_id)
+    finally:
+        connection.close()
+
+
+def schedule_fan_out(recipe):
+    pk = recipe.pk
+    transaction.on_commit(lambda: executor.submit(fan_out, pk))
+
+
+# A new follow brings the latest FEED_BACKFILL_SIZE recipes of the
+# authors into the timeline, an unfollow removes them. Celebrities are
+# backfilled too, their recipes must stay once they are fanned out again.
+def follow_authors(user, author_ids):
+    recipes = Recipe.objects.filter(author_id__in=author_ids).order_by(
+        '-pub_date', '-id').values_list('id', 'author_id', 'pub_date')
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user=user, recipe_id=pk, author_id=author_id,
+                   pub_date=pub_date)
+         for pk, author_id, pub_date in recipes[
+             :settings.FEED_BACKFILL_SIZE]), ignore_conflicts=True)
+
+
+def unfollow_authors(user, author_ids):
+    FeedEntry.objects.filter(user=user, author_id__in=author_ids).delete()
+
+
+def after(queryset, position, pk_field):
+    if position is None:
+        return queryset
+    pub_date, pk = position
+    return queryset.filter(
+        Q(pub_date__lt=pub_date)
+        | Q(pub_date=pub_date, **{f'{pk_field}__lt': pk}))
+
+
+# Ids of the size newest recipes of the feed older than position, a
+# (pub_date, id) pair. Entries of authors the user no longer follows,
+# left behind by a fan-out racing with the unfollow, are skipped.
+def timeline(user, position, size):
+    follows = Follow.objects.filter(user=user)
+    entries = after(FeedEntry.objects.filter(
+        user=user, author__in=follows.values('author')), position, 'recipe')
+    keys = list(entries.order_by('-pub_date', '-recipe').values_list(
+        'pub_date', 'recipe')[:size])
+    authors = celebrities()
+    if authors:
+        followed = follows.filter(author__in=authors).values('author')
+        recipes = after(
+            Recipe.objects.filter(author__in=followed), position, 'id')
+        keys = sorted(set(keys).union(recipes.order_by(
+            '-pub_date', '-id').values_list('pub_date', 'id')[:size]),
+            reverse=True)[:size]
+    return [pk for _, pk in keys]
@@ -1,21 +1,32 @@
 import base64
+import binascii
+import io
 import uuid
 
-import six
+from django.conf import settings
 from django.core.files.base import ContentFile
+from PIL import Image
 from rest_framework import serializers
 
 
 class Base64ImageField(serializers.ImageField):
+    default_error_messages = {
+        'too_large':
+            'Размер изображения не должен превышать {max_size} байт.',
+    }
 
     def to_internal_value(self, data):
-        if isinstance(data, six.string_types):
+        if isinstance(data, str):
             if 'data:' in data and ';base64,' in data:
                 header, data = data.split(';base64,')
 
+            max_size = settings.IMAGE_UPLOAD_MAX_SIZE
+            if len(data) // 4 * 3 > max_size:
+                self.fail('too_large', max_size=max_size)
+
             try:
                 decoded_file = base64.b64decode(data)
-            except TypeError:
+            except (TypeError, binascii.Error):
                 self.fail('invalid_image')
 
             file_name = str(uuid.uuid4())[:12]
@@ -28,9 +39,12 @@ class Base64ImageField(serializers.ImageField):
         return super().to_internal_value(data)
 
     def get_file_extension(self, file_name, decoded_file):
-        import imghdr
+        try:
+            with Image.open(io.BytesIO(decoded_file)) as image:
+                extension = image.format.lower()
+        except Exception:
+            self.fail('invalid_image')
 
-        extension = imghdr.what(file_name, decoded_file)
         extension = 'jpg' if extension == 'jpeg' else extension
 
         return extension
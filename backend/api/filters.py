@@ -1,34 +1,104 @@
-from django_filters.rest_framework import FilterSet, filters
-from rest_framework.filters import SearchFilter
-
-from foodgram_app.models import Recipe
+import re
 
+from django.db import connection
+from django.db.models import Exists, FloatField, OuterRef, Q
+from django.db.models.expressions import RawSQL
+from django_filters.rest_framework import FilterSet, filters
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.settings import api_settings
 
-class IngredientFilter(SearchFilter):
-    search_param = 'name'
+from foodgram_app.models import Favorite, Purchase, Recipe
+from foodgram_app.search import RECIPE_TABLE, SEARCH_CONFIG, SEARCH_TABLE
 
 
 class RecipeFilter(FilterSet):
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
-    author = filters.CharFilter(field_name='author__id')
+    tags = filters.CharFilter(method='filter_tags')
+    author = filters.NumberFilter(field_name='author')
     is_favorited = filters.NumberFilter(method='filter_favorite')
     is_in_shopping_cart = filters.NumberFilter(
         method='filter_shopping_cart')
+    ordering = filters.CharFilter(method='filter_ordering')
+
+    # Wanted rows are picked with a semi-join (IN over a subquery) and
+    # unwanted ones dropped with a correlated NOT EXISTS, so several tags
+    # or flags never multiply the rows and no DISTINCT is needed.
+    def filter_tags(self, queryset, name, value):
+        return queryset.filter(id__in=Recipe.tags.through.objects.filter(
+            tag__slug__in=self.data.getlist(name)).values('recipe'))
 
     def filter_favorite(self, queryset, name, value):
-        if value == 1:
-            return queryset.filter(favored_by__user=self.request.user)
-        elif value == 0:
-            return queryset.filter(favored_by__user__isnull=True)
-        return queryset
+        return self.filter_marked(queryset, 'is_favorited', Favorite, value)
 
     def filter_shopping_cart(self, queryset, name, value):
+        return self.filter_marked(
+            queryset, 'is_in_shopping_cart', Purchase, value)
+
+    def filter_marked(self, queryset, annotation, model, value):
+        user = self.request.user
         if value == 1:
-            return queryset.filter(purchased_by__user=self.request.user)
-        elif value == 0:
-            return queryset.filter(purchased_by__user__isnull=True)
+            if user.is_anonymous:
+                return queryset.none()
+            return queryset.filter(id__in=model.objects.filter(
+                user=user).values('recipe'))
+        if value == 0 and user.is_authenticated:
+            # Reuse the flag recipes_for_user() has already annotated.
+            if annotation not in queryset.query.annotations:
+                queryset = queryset.annotate(**{annotation: Exists(
+                    model.objects.filter(user=user, recipe=OuterRef('pk')))})
+            return queryset.filter(**{annotation: False})
+        return queryset
+
+    def filter_ordering(self, queryset, name, value):
+        if value == 'popular':
+            return queryset.order_by(
+                '-favorites_count', '-purchases_count', '-pub_date')
         return queryset
 
     class Meta:
         model = Recipe
         fields = ['tags', 'is_favorited', 'is_in_shopping_cart', ]
+
+
+# Matches every word of the query as a prefix of a word in the recipe
+# name or text and ranks name matches above text matches: a tsvector
+# with a GIN index on PostgreSQL, an FTS5 table on SQLite.
+class RecipeSearchFilter(BaseFilterBackend):
+    search_param = api_settings.SEARCH_PARAM
+
+    def filter_queryset(self, request, queryset, view):
+        words = re.findall(r'\w+', request.query_params.get(
+            self.search_param, ''))
+        if not words:
+            return queryset
+        if connection.vendor == 'postgresql':
+            query = ' & '.join(f'{word}:*' for word in words)
+            params = (SEARCH_CONFIG, query)
+            match = (f'{RECIPE_TABLE}.search_vector @@ '
+                     'to_tsquery(%s, %s)')
+            rank = RawSQL(
+                f'ts_rank({RECIPE_TABLE}.search_vector, '
+                'to_tsquery(%s, %s))', params, output_field=FloatField())
+        elif connection.vendor == 'sqlite':
+            query = ' '.join(f'"{word}"*' for word in words)
+            params = (query, )
+            match = (f'{RECIPE_TABLE}.id IN (SELECT rowid FROM '
+                     f'{SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s)')
+            rank = RawSQL(
+                f'(SELECT -bm25({SEARCH_TABLE}, 10.0, 1.0) '
+                f'FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+                f'AND rowid = {RECIPE_TABLE}.id)', params,
+                output_field=FloatField())
+        else:
+            condition = Q()
+            for word in words:
+                condition &= Q(name__icontains=word) | Q(
+                    text__icontains=word)
+            return queryset.filter(condition)
+        # filter(id__in=RawSQL(...)) would wrap the subquery in a second
+        # pair of parentheses, turning it into a scalar on both backends.
+        queryset = queryset.extra(where=[match], params=params).annotate(
+            search_rank=rank)
+        # An explicit ?ordering= wins over relevance.
+        if queryset.query.order_by:
+            return queryset
+        return queryset.order_by('-search_rank', '-pub_date', '-id')
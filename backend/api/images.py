@@ -0,0 +1,83 @@
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+from PIL import Image, ImageOps
+
+from foodgram_app.models import Recipe
+from .cache import bump_namespaces, recipe_namespace
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_WORKERS, thread_name_prefix='images')
+
+
+def webp(image, size):
+    image = image.copy()
+    image.thumbnail(size)
+    buffer = io.BytesIO()
+    image.save(buffer, 'WEBP', quality=settings.IMAGE_WEBP_QUALITY)
+    return ContentFile(buffer.getvalue())
+
+
+def make_variants(pk, name):
+    storage = Recipe._meta.get_field('image').storage
+    with storage.open(name) as file, Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.mode else 'RGB')
+        full = webp(image, settings.IMAGE_MAX_SIZE)
+        thumbnail = webp(image, settings.IMAGE_THUMBNAIL_SIZE)
+    base = os.path.splitext(name)[0]
+    updated = Recipe.objects.filter(pk=pk, image=name).update(
+        image_webp=storage.save(f'{base}.webp', full),
+        image_thumbnail=storage.save(f'{base}_thumb.webp', thumbnail))
+    if updated:
+        bump_namespaces('recipe-list', recipe_namespace(pk))
+    return updated
+
+
+def build_variants(pk, name):
+    try:
+        make_variants(pk, name)
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', name)
+    finally:
+        connection.close()
+
+
+def schedule_variants(recipe):
+    pk, name = recipe.pk, recipe.image.name
+    transaction.on_commit(lambda: executor.submit(build_variants, pk, name))
+
+
+# Whatever saves the recipe, the API, the admin or the shell, a new image
+# drops the variants of the old one and gets its own built. The name is
+# compared before the save: the upload only gets its final name when the
+# field commits the file.
+@receiver(pre_save, sender=Recipe)
+def clear_variants(instance, raw, update_fields=None, **kwargs):
+    instance._image_changed = False
+    if raw or (update_fields is not None and 'image' not in update_fields):
+        return
+    stored = None
+    if instance.pk is not None:
+        stored = Recipe.objects.filter(pk=instance.pk).values_list(
+            'image', flat=True).first()
+    if instance.image.name and instance.image.name != stored:
+        instance._image_changed = True
+        instance.image_webp = instance.image_thumbnail = ''
+
+
+@receiver(post_save, sender=Recipe)
+def build_new_variants(instance, **kwargs):
+    if instance._image_changed:
+        instance._image_changed = False
+        schedule_variants(instance)
@@ -0,0 +1,65 @@
+import bisect
+import itertools
+import threading
+import time
+
+from django.conf import settings
+
+from foodgram_app.models import Ingredient
+from .cache import bump_namespaces, namespace_versions
+from .replicas import primary
+
+
+# The snapshot is tied to the version of the 'ingredients' cache
+# namespace, so with a shared cache backend a change made in one worker
+# rebuilds the index in all of them; otherwise other workers catch up
+# after INGREDIENT_INDEX_MAX_AGE seconds.
+class IngredientIndex:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def invalidate(self):
+        bump_namespaces('ingredients')
+        self._snapshot = None
+
+    def _load(self):
+        version = namespace_versions(['ingredients'])[0]
+        snapshot = self._snapshot
+        if (snapshot is not None and snapshot[0] == version
+                and time.monotonic() - snapshot[1]
+                < settings.INGREDIENT_INDEX_MAX_AGE):
+            return snapshot
+        with self._lock:
+            if self._snapshot is snapshot:
+                with primary():
+                    rows = sorted(
+                        (name.casefold(), pk, name, unit)
+                        for pk, name, unit in Ingredient.objects.values_list(
+                            'id', 'name', 'measurement_unit'))
+                keys = [row[0] for row in rows]
+                self._snapshot = (version, time.monotonic(), keys, rows)
+            return self._snapshot
+
+    def search(self, query, limit=None):
+        if limit is None:
+            limit = settings.INGREDIENT_SEARCH_LIMIT
+        query = query.strip().casefold()
+        _, _, keys, rows = self._load()
+        start = bisect.bisect_left(keys, query)
+        end = bisect.bisect_left(keys, query + '\U0010ffff', lo=start)
+        matches = rows[start:min(end, start + limit)]
+        if len(matches) < limit:
+            for index in itertools.chain(range(start),
+                                         range(end, len(rows))):
+                if query in keys[index]:
+                    matches.append(rows[index])
+                    if len(matches) == limit:
+                        break
+        return [
+            {'id': pk, 'name': name, 'measurement_unit': unit}
+            for _, pk, name, unit in matches]
+
+
+ingredient_index = IngredientIndex()
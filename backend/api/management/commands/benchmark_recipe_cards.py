@@ -0,0 +1,118 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import (setup_test_environment,
+                               teardown_test_environment)
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.recipe_cards import recipe_cards, recipe_rows
+from api.serializers import RecipeReadSerializer
+from api.utils import recipes_for_user
+from foodgram_app.models import (Favorite, Follow, Ingredient, Recipe,
+                                 RecipeIngredient, Tag)
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = ('Seeds a throwaway database and compares building a page of '
+            'recipe cards with RecipeReadSerializer and with recipe_cards().')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--tags-per-recipe', type=int, default=3)
+        parser.add_argument('--repeats', type=int, default=200)
+
+    def handle(self, *args, **options):
+        self.options = options
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True)
+        try:
+            request = self.seed()
+            self.measure(request)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def seed(self):
+        options = self.options
+        size = options['page_size']
+        CustomUser.objects.bulk_create(
+            CustomUser(email=f'benchmark{index}@example.com',
+                       username=f'benchmark{index}')
+            for index in range(10))
+        users = list(CustomUser.objects.order_by('id'))
+        Tag.objects.bulk_create(
+            Tag(name=f'Тег {index}', color=f'#{index:06x}',
+                slug=f'tag-{index}')
+            for index in range(options['tags_per_recipe'] * 2))
+        tags = list(Tag.objects.order_by('id'))
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Продукт {index}', measurement_unit='г')
+            for index in range(size))
+        ingredients = list(Ingredient.objects.order_by('id'))
+        Recipe.objects.bulk_create(
+            Recipe(author=users[index % len(users)],
+                   name=f'Рецепт {index}', text='Описание',
+                   cooking_time=10, image=f'recipe{index}.png',
+                   image_webp=f'recipe{index}.webp' if index % 2 else '')
+            for index in range(size))
+        recipes = list(Recipe.objects.order_by('id'))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, amount=offset + 1, ingredient=ingredients[
+                    (index + offset) % len(ingredients)])
+            for index, recipe in enumerate(recipes)
+            for offset in range(options['ingredients_per_recipe']))
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tags[
+                (index + offset) % len(tags)])
+            for index, recipe in enumerate(recipes)
+            for offset in range(options['tags_per_recipe']))
+        reader = users[0]
+        Favorite.objects.bulk_create(
+            Favorite(user=reader, recipe=recipe) for recipe in recipes[::3])
+        Follow.objects.bulk_create(
+            Follow(user=reader, author=author) for author in users[1::2])
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = reader
+        return request
+
+    def serializer_page(self, request):
+        recipes = list(recipes_for_user(request.user)[
+            :self.options['page_size']])
+        return RecipeReadSerializer(
+            recipes, many=True, context={'request': request}).data
+
+    def cards_page(self, request):
+        return recipe_cards(list(recipe_rows(request.user)[
+            :self.options['page_size']]), request)
+
+    def time(self, build, request):
+        timings = []
+        for _ in range(self.options['repeats']):
+            started = time.perf_counter()
+            build(request)
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def measure(self, request):
+        renderer = JSONRenderer()
+        if (renderer.render(self.serializer_page(request))
+                != renderer.render(self.cards_page(request))):
+            self.stdout.write(self.style.ERROR(
+                'recipe_cards() output differs from RecipeReadSerializer.'))
+            return
+        serializer = self.time(self.serializer_page, request)
+        cards = self.time(self.cards_page, request)
+        self.stdout.write(
+            f'{self.options["page_size"]} recipes on {connection.vendor}, '
+            f'median of {self.options["repeats"]} runs, queries included: '
+            f'RecipeReadSerializer {serializer:.2f} ms, '
+            f'recipe_cards {cards:.2f} ms, {serializer / cards:.1f}x faster')
+        self.stdout.write(self.style.SUCCESS('Outputs are identical.'))
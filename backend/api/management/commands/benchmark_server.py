@@ -0,0 +1,155 @@
+import os
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.management.timings import percentile
+
+URLS = (
+    '/api/recipes/',
+    '/api/recipes/?limit=20&is_favorited=0',
+    '/api/tags/',
+    '/api/ingredients/?name=с',
+)
+# Defaults with --token: what a signed-in user reads, never cached.
+TOKEN_URLS = (
+    '/api/recipes/',
+    '/api/recipes/feed/',
+    '/api/users/subscriptions/',
+    '/api/recipes/download_shopping_cart/',
+)
+# Turn the response and count caches off, so that the requests reach the
+# views and the database instead of measuring cache hits.
+NO_CACHE = {'RESPONSE_CACHE_TIMEOUT': '0', 'PAGINATION_COUNT_TIMEOUT': '0'}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = ('Starts gunicorn with each of the given worker setups against '
+            'the configured database and compares throughput and latency '
+            'under concurrent load.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--setup', action='append', dest='setups',
+            help='worker_class:workers[:threads], e.g. sync:4 or '
+                 'gthread:4:8. Defaults to sync:4 and gthread:4:8.')
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument(
+            '--url', action='append', dest='urls',
+            help='Path to request, may be repeated. Defaults to the '
+                 'signed-in pages with --token, anonymous ones otherwise.')
+        parser.add_argument(
+            '--token', help='Send requests as the owner of this token.')
+        parser.add_argument(
+            '--cached', action='store_true',
+            help='Keep the response cache on; by default it is off.')
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        self.options = options
+        setups = options['setups'] or ['sync:4', 'gthread:4:8']
+        self.stdout.write(
+            f'{"setup":<16}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}'
+            f'{"errors":>8}')
+        # The servers started here must not empty or add to the metrics
+        # directory of the running site.
+        self.metrics_dir = tempfile.mkdtemp(prefix='foodgram-benchmark-')
+        try:
+            for setup in setups:
+                self.run_setup(setup)
+        finally:
+            shutil.rmtree(self.metrics_dir, ignore_errors=True)
+
+    def run_setup(self, setup):
+        port = free_port()
+        server = self.start(setup, port)
+        try:
+            result = self.load(port)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=30)
+        self.stdout.write(
+            f'{setup:<16}{result["rps"]:>10}{result["p50"]:>10}'
+            f'{result["p95"]:>10}{result["errors"]:>8}')
+
+    def start(self, setup, port):
+        worker_class, workers, *threads = setup.split(':')
+        executable = shutil.which('gunicorn')
+        if executable is None:
+            raise CommandError('gunicorn is not installed')
+        command = [
+            executable, 'foodgram.wsgi:application',
+            '--bind', f'127.0.0.1:{port}', '--worker-class', worker_class,
+            '--workers', workers, '--log-level', 'warning']
+        if threads:
+            command += ['--threads', threads[0]]
+        env = {**os.environ, 'METRICS_DIR': self.metrics_dir}
+        if not self.options['cached']:
+            env.update(NO_CACHE)
+        server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'{setup}: gunicorn exited on start')
+            try:
+                socket.create_connection(('127.0.0.1', port), 1).close()
+                return server
+            except OSError:
+                time.sleep(0.2)
+        server.kill()
+        raise CommandError(f'{setup}: gunicorn did not start in 30 s')
+
+    def fetch(self, url):
+        request = urllib.request.Request(url)
+        if self.options['token']:
+            request.add_header(
+                'Authorization', f'Token {self.options["token"]}')
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(
+                    request, timeout=self.options['timeout']) as response:
+                response.read()
+            ok = True
+        except (urllib.error.URLError, socket.timeout):
+            ok = False
+        return (time.perf_counter() - started) * 1000, ok
+
+    def load(self, port):
+        default = TOKEN_URLS if self.options['token'] else URLS
+        paths = [urllib.parse.quote(path, safe='/?=&')
+                 for path in self.options['urls'] or default]
+        urls = [
+            f'http://127.0.0.1:{port}{paths[index % len(paths)]}'
+            for index in range(self.options['requests'])]
+        # One warm-up request per path so that the ingredient index (and
+        # with --cached the caches) are built before the clock starts.
+        for path in paths:
+            self.fetch(f'http://127.0.0.1:{port}{path}')
+        started = time.perf_counter()
+        with ThreadPoolExecutor(self.options['concurrency']) as executor:
+            results = list(executor.map(self.fetch, urls))
+        elapsed = time.perf_counter() - started
+        timings = [timing for timing, ok in results if ok]
+        return {
+            'rps': round(len(timings) / elapsed, 1),
+            'p50': round(statistics.median(timings), 1) if timings else '-',
+            'p95': round(percentile(timings, 0.95), 1) if timings else '-',
+            'errors': len(results) - len(timings)}
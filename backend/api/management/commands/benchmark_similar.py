@@ -0,0 +1,104 @@
+import statistics
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import (setup_test_environment,
+                               teardown_test_environment)
+
+from api.management.timings import percentile
+from api.similar import hashes, similar_recipes, store
+from foodgram_app.models import Recipe
+from users.models import CustomUser
+
+BATCH_SIZE = 10000
+
+
+class Command(BaseCommand):
+    help = ('Seeds a throwaway database with synthetic recipes, builds the '
+            'similar recipes index for them and measures lookup latency.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1000000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument(
+            '--cuisines', type=int, default=5000,
+            help='Recipes of one cuisine draw most of their ingredients '
+                 'from a shared pool, which makes them similar.')
+        parser.add_argument('--lookups', type=int, default=1000)
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.random = np.random.RandomState(options['seed'])
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True)
+        try:
+            started = time.perf_counter()
+            ids = self.seed()
+            self.stdout.write(
+                f'Indexed {len(ids)} recipes in '
+                f'{time.perf_counter() - started:.1f} s')
+            self.measure(ids)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def ingredient_sets(self, size):
+        options = self.options
+        per_recipe = options['ingredients_per_recipe']
+        shared = per_recipe - per_recipe // 4
+        pools = np.arange(options['cuisines'] * 2 * per_recipe).reshape(
+            options['cuisines'], -1) % options['ingredients'] + 1
+        cuisines = self.random.randint(options['cuisines'], size=size)
+        picks = np.argsort(self.random.rand(size, pools.shape[1]), axis=1)
+        own = np.take_along_axis(pools[cuisines], picks[:, :shared], axis=1)
+        extra = self.random.randint(
+            1, options['ingredients'] + 1, size=(size, per_recipe - shared))
+        return np.hstack([own, extra])
+
+    def seed(self):
+        author = CustomUser.objects.create(
+            email='benchmark@example.com', username='benchmark')
+        table = hashes(np.arange(self.options['ingredients'] + 1))
+        ids = []
+        for start in range(0, self.options['recipes'], BATCH_SIZE):
+            size = min(BATCH_SIZE, self.options['recipes'] - start)
+            with transaction.atomic():
+                recipes = Recipe.objects.bulk_create(
+                    Recipe(author=author, name=f'Рецепт {start + index}',
+                           text='Описание', cooking_time=10,
+                           image='benchmark.png')
+                    for index in range(size))
+                batch = [recipe.pk for recipe in recipes]
+                if batch[0] is None:
+                    batch = list(Recipe.objects.order_by('-id').values_list(
+                        'id', flat=True)[:size])[::-1]
+                signatures = table[:, self.ingredient_sets(size)].min(
+                    axis=2).T
+                store(batch, signatures)
+            ids += batch
+        return ids
+
+    def measure(self, ids):
+        timings = []
+        found = []
+        for pk in self.random.choice(ids, self.options['lookups']).tolist():
+            started = time.perf_counter()
+            scores = similar_recipes(pk, self.options['limit'])
+            timings.append((time.perf_counter() - started) * 1000)
+            found.append(len(scores))
+        p95 = percentile(timings, 0.95)
+        self.stdout.write(
+            f'{len(timings)} lookups on {connection.vendor}: '
+            f'p50 {statistics.median(timings):.2f} ms, p95 {p95:.2f} ms, '
+            f'max {max(timings):.2f} ms, '
+            f'{statistics.mean(found):.1f} similar recipes on average')
+        if p95 < 10:
+            self.stdout.write(self.style.SUCCESS('p95 is under 10 ms.'))
+        else:
+            self.stdout.write(self.style.WARNING('p95 is 10 ms or more.'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from api.images import make_variants
+from foodgram_app.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Строит WebP-версии и миниатюры изображений рецептов, у которых '
+            'их нет, например созданных до их появления.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Перестроить версии всех изображений.')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(
+                Q(image_webp='') | Q(image_webp__isnull=True)
+                | Q(image_thumbnail='') | Q(image_thumbnail__isnull=True))
+        built = failed = 0
+        for pk, name in recipes.values_list('pk', 'image').iterator():
+            try:
+                built += make_variants(pk, name)
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'{name}: {error}')
+        self.stdout.write(f'Обработано изображений: {built}, ошибок: {failed}')
@@ -0,0 +1,433 @@
+import base64
+import csv
+import io
+import json
+import os
+import re
+import shutil
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (CaptureQueriesContext,
+                               setup_test_environment,
+                               teardown_test_environment)
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.feed import celebrities, follow_authors
+from api.management.timings import percentile
+from api.shopping_list import rebuild_shopping_lists
+from api.similar import rebuild_similar_index
+from foodgram_app.models import (Favorite, Follow, Ingredient, Purchase,
+                                 Recipe, RecipeIngredient, Tag)
+from users.models import CustomUser
+
+BUDGET_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+    'api_budget.json')
+PASSWORD = 'benchmark-password'
+# Indexes the hot queries of an endpoint are expected to use.
+EXPLAIN_INDEXES = {
+    'recipes-list-cursor': ('recipe_feed_idx', ),
+    'recipes-list-filtered': (),
+    'recipes-search': ('foodgram_app_recipe_search', ),
+    'recipes-feed': ('feed_timeline_idx', ),
+    'recipes-detail': ('recipe_ingredient_idx', ),
+    'recipes-similar': ('recipe_bucket_idx', ),
+    'recipes-delete': ('favorite_recipe_user_idx',
+                       'purchase_recipe_user_idx', 'recipe_ingredient_idx'),
+    'download-shopping-cart': (),
+    'shopping-cart-summary': (),
+    'subscriptions': ('recipe_author_feed_idx', ),
+}
+EXPLAIN = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+}
+
+
+def png_bytes():
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), 'white').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def full_scans(plan):
+    if connection.vendor == 'postgresql':
+        return re.findall(r'Seq Scan on (\S+)', plan)
+    # SQLite reports a full scan as "SCAN <table>" without "USING";
+    # scans of its own co-routines and materialized subqueries and of the
+    # FTS5 table, which reads its own index, are fine.
+    coroutines = set(re.findall(r'(?:CO-ROUTINE|MATERIALIZE) (\S+)', plan))
+    return [
+        table for table, using in re.findall(
+            r'SCAN (\S+)( USING| VIRTUAL TABLE)?', plan)
+        if not using and table not in coroutines
+        and not table.startswith('(')]
+
+
+class Command(BaseCommand):
+    help = ('Seeds a throwaway database, measures SQL query count and '
+            'p50/p95 latency of every API endpoint and compares them '
+            'with the committed budget.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--recipes', type=int, default=200)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--ingredients-file', default=os.path.join(
+            settings.DATA_DIR, 'ingredients.csv'))
+        parser.add_argument('--tags-file', default=os.path.join(
+            settings.DATA_DIR, 'tags.csv'))
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--budget', default=BUDGET_FILE)
+        parser.add_argument(
+            '--write-budget', action='store_true',
+            help='Store the measured values as the new budget.')
+        parser.add_argument(
+            '--time-headroom', type=float, default=3.0,
+            help='Multiplier applied to timings when writing the budget.')
+        parser.add_argument(
+            '--skip-timings', action='store_true',
+            help='Only compare query counts with the budget.')
+        parser.add_argument(
+            '--explain', action='store_true',
+            help='Check that hot queries use their indexes and do not '
+                 'scan whole tables (SQLite and PostgreSQL).')
+
+    def handle(self, *args, **options):
+        self.options = options
+        for path in (options['ingredients_file'], options['tags_file']):
+            if not os.path.isfile(path):
+                raise CommandError(
+                    f'{path} not found; pass --ingredients-file and '
+                    '--tags-file or set DATA_DIR.')
+        media_root = tempfile.mkdtemp()
+        old_media_root = settings.MEDIA_ROOT
+        settings.MEDIA_ROOT = media_root
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True)
+        try:
+            self.seed()
+            self.plans = {}
+            results = self.measure()
+            if options['explain']:
+                errors = self.check_plans()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            settings.MEDIA_ROOT = old_media_root
+            shutil.rmtree(media_root, ignore_errors=True)
+        self.report(results)
+        if options['explain']:
+            if errors:
+                raise CommandError(
+                    'Query plans do not use indexes:\n' + '\n'.join(errors))
+            self.stdout.write(self.style.SUCCESS('Query plans use indexes.'))
+        if options['write_budget']:
+            self.write_budget(results)
+        else:
+            self.check_budget(results)
+
+    def seed(self):
+        options = self.options
+        with open(options['tags_file'], encoding='utf-8') as file:
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in csv.reader(file))
+        with open(options['ingredients_file'], encoding='utf-8') as file:
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=name, measurement_unit=unit)
+                 for name, unit in csv.reader(file)))
+        users = [
+            CustomUser(
+                email=f'user{index}@example.com', username=f'user{index}',
+                first_name='Имя', last_name='Фамилия')
+            for index in range(options['users'])]
+        for user in users:
+            user.set_password(PASSWORD)
+        CustomUser.objects.bulk_create(users)
+        users = list(CustomUser.objects.order_by('id'))
+        image = ContentFile(png_bytes(), name='benchmark.png')
+        image_name = Recipe._meta.get_field('image').storage.save(
+            image.name, image)
+        Recipe.objects.bulk_create(
+            (Recipe(
+                author=users[index % len(users)], name=f'Рецепт {index}',
+                text='Описание', cooking_time=index % 60 + 1,
+                image=image_name)
+             for index in range(options['recipes'])))
+        recipes = list(Recipe.objects.values_list('id', flat=True))
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        tags = list(Tag.objects.values_list('id', flat=True))
+        per_recipe = options['ingredients_per_recipe']
+        RecipeIngredient.objects.bulk_create(
+            (RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredients[
+                    (recipe_id * per_recipe + offset) % len(ingredients)],
+                amount=offset + 1)
+             for recipe_id in recipes for offset in range(per_recipe)))
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe_id,
+                                tag_id=tags[recipe_id % len(tags)])
+            for recipe_id in recipes)
+        self.user = users[0]
+        self.other = users[1]
+        marked = recipes[::3]
+        Favorite.objects.bulk_create(
+            Favorite(user=self.user, recipe_id=recipe_id)
+            for recipe_id in marked)
+        Purchase.objects.bulk_create(
+            Purchase(user=self.user, recipe_id=recipe_id)
+            for recipe_id in marked)
+        Follow.objects.bulk_create(
+            Follow(user=self.user, author=author) for author in users[2:])
+        follow_authors(self.user, [author.id for author in users[2:]])
+        # Measure the feed with the celebrity set cached, as it mostly is.
+        celebrities()
+        rebuild_shopping_lists()
+        rebuild_similar_index()
+        self.token = Token.objects.create(user=self.user)
+        self.recipe = Recipe.objects.filter(author=self.user).first()
+        self.target = Recipe.objects.exclude(id__in=marked).first()
+        self.ingredients = ingredients[:per_recipe]
+        self.tags = tags
+        self.image = 'data:image/png;base64,' + base64.b64encode(
+            png_bytes()).decode()
+        self.counter = 0
+
+    def client(self, authenticated=True):
+        client = APIClient()
+        if authenticated:
+            client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        return client
+
+    def recipe_payload(self):
+        return {
+            'ingredients': [{'id': pk, 'amount': 10}
+                            for pk in self.ingredients],
+            'tags': self.tags[:1],
+            'image': self.image, 'name': 'Бенчмарк', 'text': 'Описание',
+            'cooking_time': 10}
+
+    def next_user(self):
+        self.counter += 1
+        return {'email': f'new{self.counter}@example.com',
+                'username': f'new{self.counter}', 'first_name': 'Имя',
+                'last_name': 'Фамилия', 'password': PASSWORD}
+
+    def endpoints(self):
+        recipe = f'/api/recipes/{self.recipe.id}/'
+        target = f'/api/recipes/{self.target.id}'
+        other = f'/api/users/{self.other.id}'
+        created = []
+        tokens = []
+        batch = list(Recipe.objects.exclude(
+            favored_by__user=self.user).values_list('id', flat=True)[:20])
+
+        def create_recipe(client):
+            response = client.post(
+                '/api/recipes/', self.recipe_payload(), format='json')
+            created.append(response.data['id'])
+            return response
+
+        def delete_recipe(client):
+            return client.delete(f'/api/recipes/{created.pop()}/')
+
+        def login(client):
+            response = client.post('/api/auth/token/login/', {
+                'email': self.other.email, 'password': PASSWORD})
+            tokens.append(response.data['auth_token'])
+            return response
+
+        def logout(client):
+            client.credentials(HTTP_AUTHORIZATION=f'Token {tokens.pop()}')
+            return client.post('/api/auth/token/logout/')
+
+        # Endpoints of one group run one after another on every repeat,
+        # so that paired writes leave the dataset unchanged.
+        return [
+            [('recipes-list', 200, False,
+              lambda c: c.get('/api/recipes/'))],
+            [('recipes-list-auth', 200, True,
+              lambda c: c.get('/api/recipes/'))],
+            [('recipes-list-auth-limit-100', 200, True,
+              lambda c: c.get('/api/recipes/?limit=100'))],
+            [('recipes-list-filtered', 200, True,
+              lambda c: c.get('/api/recipes/?is_favorited=1'
+                              '&is_in_shopping_cart=1&tags=lunch'))],
+            [('recipes-list-cursor', 200, True,
+              lambda c: c.get('/api/recipes/?cursor=&limit=20'))],
+            [('recipes-search', 200, True,
+              lambda c: c.get('/api/recipes/?search=рецепт 1'))],
+            [('recipes-feed', 200, True,
+              lambda c: c.get('/api/recipes/feed/?limit=20'))],
+            [('recipes-detail', 200, True, lambda c: c.get(recipe))],
+            [('recipes-similar', 200, False,
+              lambda c: c.get(f'{recipe}similar/'))],
+            [('recipes-pantry', 200, False,
+              lambda c: c.get('/api/recipes/pantry/', {
+                  'ingredients': self.ingredients, 'missing': 2}))],
+            [('recipes-create', 201, True, create_recipe),
+             ('recipes-delete', 204, True, delete_recipe)],
+            [('recipes-update', 200, True,
+              lambda c: c.patch(recipe, self.recipe_payload(),
+                                format='json'))],
+            [('favorite-add', 201, True,
+              lambda c: c.post(f'{target}/favorite/')),
+             ('favorite-remove', 204, True,
+              lambda c: c.delete(f'{target}/favorite/'))],
+            [('shopping-cart-add', 201, True,
+              lambda c: c.post(f'{target}/shopping_cart/')),
+             ('shopping-cart-remove', 204, True,
+              lambda c: c.delete(f'{target}/shopping_cart/'))],
+            [('favorite-batch-add', 200, True,
+              lambda c: c.post('/api/recipes/favorite/',
+                               {'ids': batch}, format='json')),
+             ('favorite-batch-remove', 200, True,
+              lambda c: c.delete('/api/recipes/favorite/',
+                                 {'ids': batch}, format='json'))],
+            [('subscribe-batch', 200, True,
+              lambda c: c.post('/api/users/subscribe/',
+                               {'ids': [self.other.id]}, format='json')),
+             ('unsubscribe-batch', 200, True,
+              lambda c: c.delete('/api/users/subscribe/',
+                                 {'ids': [self.other.id]}, format='json'))],
+            [('shopping-cart-batch-add', 200, True,
+              lambda c: c.post('/api/recipes/shopping_cart/',
+                               {'ids': batch}, format='json')),
+             ('shopping-cart-batch-remove', 200, True,
+              lambda c: c.delete('/api/recipes/shopping_cart/',
+                                 {'ids': batch}, format='json'))],
+            [('download-shopping-cart', 200, True,
+              lambda c: c.get('/api/recipes/download_shopping_cart/'))],
+            [('shopping-cart-summary', 200, True,
+              lambda c: c.get('/api/recipes/shopping_cart/summary/'))],
+            [('subscribe', 201, True,
+              lambda c: c.post(f'{other}/subscribe/')),
+             ('unsubscribe', 204, True,
+              lambda c: c.delete(f'{other}/subscribe/'))],
+            [('subscriptions', 200, True,
+              lambda c: c.get('/api/users/subscriptions/?recipes_limit=3'))],
+            [('tags-list', 200, False, lambda c: c.get('/api/tags/'))],
+            [('ingredients-search', 200, False,
+              lambda c: c.get('/api/ingredients/?name=м'))],
+            [('users-list', 200, True, lambda c: c.get('/api/users/'))],
+            [('users-detail', 200, True, lambda c: c.get(f'{other}/'))],
+            [('users-me', 200, True, lambda c: c.get('/api/users/me/'))],
+            [('users-create', 201, False,
+              lambda c: c.post('/api/users/', self.next_user()))],
+            [('token-login', 200, False, login),
+             ('token-logout', 204, False, logout)],
+        ]
+
+    def measure(self):
+        results = {}
+        for group in self.endpoints():
+            timings = {name: [] for name, *_ in group}
+            queries = dict.fromkeys(timings, 0)
+            for _ in range(self.options['repeat']):
+                for name, expected, authenticated, call in group:
+                    client = self.client(authenticated)
+                    with CaptureQueriesContext(connection) as context:
+                        started = time.perf_counter()
+                        response = call(client)
+                        if response.streaming:
+                            b''.join(response.streaming_content)
+                        elapsed = time.perf_counter() - started
+                    if response.status_code != expected:
+                        raise CommandError(
+                            f'{name}: expected {expected}, '
+                            f'got {response.status_code}')
+                    timings[name].append(elapsed * 1000)
+                    queries[name] = max(queries[name], len(context))
+                    if name in EXPLAIN_INDEXES and name not in self.plans:
+                        self.plans[name] = [
+                            query['sql'] for query in context.captured_queries
+                            if query['sql'].startswith(
+                                ('SELECT', 'DELETE', 'UPDATE'))]
+            for name, values in timings.items():
+                results[name] = {
+                    'queries': queries[name],
+                    'p50_ms': round(statistics.median(values), 2),
+                    'p95_ms': round(percentile(values, 0.95), 2)}
+        return results
+
+    def check_plans(self):
+        if connection.vendor not in EXPLAIN:
+            raise CommandError(
+                f'--explain is not supported on {connection.vendor}')
+        errors = []
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # The seeded tables are small enough for the planner to
+                # prefer sequential scans, so only allow them as a last
+                # resort.
+                cursor.execute('SET enable_seqscan = off')
+            for name, statements in self.plans.items():
+                plan = []
+                for sql in statements:
+                    cursor.execute(EXPLAIN[connection.vendor] + sql)
+                    lines = '\n'.join(
+                        str(row[-1]) for row in cursor.fetchall())
+                    for table in full_scans(lines):
+                        errors.append(
+                            f'{name}: full scan of {table} in {sql}')
+                    plan.append(lines)
+                plan = '\n'.join(plan)
+                for index in EXPLAIN_INDEXES[name]:
+                    if index not in plan:
+                        errors.append(f'{name}: {index} is not used')
+            if connection.vendor == 'postgresql':
+                cursor.execute('RESET enable_seqscan')
+        return errors
+
+    def report(self, results):
+        self.stdout.write(
+            f'{"endpoint":<30}{"queries":>8}{"p50 ms":>10}{"p95 ms":>10}')
+        for name, values in results.items():
+            self.stdout.write(
+                f'{name:<30}{values["queries"]:>8}'
+                f'{values["p50_ms"]:>10}{values["p95_ms"]:>10}')
+
+    def write_budget(self, results):
+        headroom = self.options['time_headroom']
+        budget = {
+            name: {
+                'queries': values['queries'],
+                'p50_ms': round(values['p50_ms'] * headroom, 1),
+                'p95_ms': round(values['p95_ms'] * headroom, 1)}
+            for name, values in results.items()}
+        with open(self.options['budget'], 'w', encoding='utf-8') as file:
+            json.dump(budget, file, indent=4, sort_keys=True)
+            file.write('\n')
+        self.stdout.write(f'Budget written to {self.options["budget"]}')
+
+    def check_budget(self, results):
+        with open(self.options['budget'], encoding='utf-8') as file:
+            budget = json.load(file)
+        metrics = ['queries']
+        if not self.options['skip_timings']:
+            metrics += ['p50_ms', 'p95_ms']
+        errors = []
+        for name, values in results.items():
+            if name not in budget:
+                errors.append(f'{name}: no budget entry')
+                continue
+            for metric in metrics:
+                if values[metric] > budget[name][metric]:
+                    errors.append(
+                        f'{name}: {metric} {values[metric]} > '
+                        f'{budget[name][metric]}')
+        if errors:
+            raise CommandError(
+                'API budget exceeded:\n' + '\n'.join(errors))
+        self.stdout.write(self.style.SUCCESS('API budget respected.'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.pantry import pantry_index
+
+
+class Command(BaseCommand):
+    help = ('Строит индекс поиска рецептов по продуктам и показывает, '
+            'сколько памяти он занимает.')
+
+    def handle(self, *args, **options):
+        stats = pantry_index.stats()
+        self.stdout.write(
+            f'Продуктов: {stats["ingredients"]}, рецептов: '
+            f'{stats["recipes"]}, записей: {stats["postings"]}, '
+            f'памяти: {stats["memory_bytes"] / 1024:.1f} КиБ')
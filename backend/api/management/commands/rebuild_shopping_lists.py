@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.shopping_list import rebuild_shopping_lists
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает списки покупок всех пользователей по рецептам '
+            'в их корзинах и исправляет расхождения.')
+
+    def handle(self, *args, **options):
+        created, updated, deleted = rebuild_shopping_lists()
+        self.stdout.write(
+            f'Добавлено: {created}, исправлено: {updated}, '
+            f'удалено: {deleted}')
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.similar import rebuild_similar_index
+
+
+class Command(BaseCommand):
+    help = ('Заново строит MinHash-подписи и LSH-корзины всех рецептов для '
+            'поиска похожих рецептов.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        indexed = rebuild_similar_index()
+        self.stdout.write(
+            f'Проиндексировано рецептов: {indexed} за '
+            f'{time.perf_counter() - started:.1f} с')
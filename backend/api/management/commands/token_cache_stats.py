@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from api.authentication import stats
+from api.cache import cache_is_shared
+
+
+class Command(BaseCommand):
+    help = ('Показывает попадания и промахи кеша токенов авторизации; '
+            'счётчики хранятся в общем кеше и суммируют все процессы.')
+
+    def handle(self, *args, **options):
+        if not cache_is_shared():
+            # The counters would live in this command's own LocMem cache.
+            self.stdout.write(self.style.WARNING(
+                'Кеш токенов выключен: CACHE_BACKEND хранит данные внутри '
+                'процесса, токены читаются из базы.'))
+            return
+        counters = stats()
+        total = counters['hits'] + counters['misses']
+        ratio = counters['hits'] / total * 100 if total else 0
+        self.stdout.write(
+            f'Попаданий: {counters["hits"]}, промахов: '
+            f'{counters["misses"]}, доля попаданий: {ratio:.1f}%')
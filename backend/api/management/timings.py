@@ -0,0 +1,6 @@
+# Helpers shared by check_api_budget and the benchmark commands.
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(share * (len(values) - 1))))]
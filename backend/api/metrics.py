@@ -0,0 +1,240 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from rest_framework import serializers
+
+from .authentication import stats as token_cache_stats
+from .cache import cache_is_shared
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+HISTOGRAMS = {
+    'foodgram_request_duration_seconds': (
+        SECONDS_BUCKETS, 'Time spent handling the request.'),
+    'foodgram_request_db_seconds': (
+        SECONDS_BUCKETS, 'Time spent in SQL queries.'),
+    'foodgram_request_serializer_seconds': (
+        SECONDS_BUCKETS, 'Time spent building serializer output.'),
+    'foodgram_request_queries': (
+        QUERY_BUCKETS, 'Number of SQL queries.'),
+}
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_state = threading.local()
+
+
+# Every process keeps its histograms in memory. In gunicorn workers
+# (METRICS_SHARED, set by gunicorn.conf.py) a background thread writes
+# them to the process's own file in METRICS_DIR every
+# METRICS_FLUSH_INTERVAL seconds and the metrics view sums the files of
+# all processes, so any worker can answer the scrape. Files of exited
+# workers are kept, otherwise the totals would go down; gunicorn.conf.py
+# empties the directory on start. Other processes, runserver and
+# management commands, only report their own requests and never touch
+# the directory.
+class Registry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _start(self):
+        # Called under the lock; a forked worker must not report its
+        # parent's requests, and threads do not survive the fork.
+        self._pid = os.getpid()
+        self._path = os.path.join(
+            settings.METRICS_DIR, f'{self._pid}-{time.time_ns()}.json')
+        self._values = {}
+        self._dirty = False
+        if settings.METRICS_SHARED:
+            threading.Thread(
+                target=self._run, name='metrics', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            self.flush()
+
+    def observe(self, view, values):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._start()
+            for name, value in values.items():
+                buckets = HISTOGRAMS[name][0]
+                series = self._values.setdefault(
+                    f'{name} {view}', [0] * (len(buckets) + 2))
+                for index, bound in enumerate(buckets):
+                    if value <= bound:
+                        series[index] += 1
+                series[-2] += value
+                series[-1] += 1
+            self._dirty = True
+
+    def flush(self):
+        with self._lock:
+            if (not settings.METRICS_SHARED or self._pid != os.getpid()
+                    or not self._dirty):
+                return
+            os.makedirs(settings.METRICS_DIR, exist_ok=True)
+            handle, path = tempfile.mkstemp(dir=settings.METRICS_DIR)
+            with os.fdopen(handle, 'w') as file:
+                json.dump(self._values, file)
+            os.replace(path, self._path)
+            self._dirty = False
+
+    def collect(self):
+        if not settings.METRICS_SHARED:
+            with self._lock:
+                if self._pid != os.getpid():
+                    return {}
+                return {key: list(series)
+                        for key, series in self._values.items()}
+        self.flush()
+        totals = {}
+        try:
+            names = os.listdir(settings.METRICS_DIR)
+        except FileNotFoundError:
+            names = []
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(settings.METRICS_DIR, name)) as file:
+                    values = json.load(file)
+            except (FileNotFoundError, ValueError):
+                continue
+            for key, series in values.items():
+                total = totals.setdefault(key, [0] * len(series))
+                for index, value in enumerate(series):
+                    total[index] += value
+        return totals
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+
+def label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def render(totals):
+    lines = []
+    for name, (buckets, description) in HISTOGRAMS.items():
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+        for key in sorted(key for key in totals if key.split(' ')[0] == name):
+            series = totals[key]
+            view = label(key.split(' ', 1)[1])
+            for bound, count in zip(buckets + ('+Inf', ), series[:-2]
+                                    + [series[-1]]):
+                lines.append(
+                    f'{name}_bucket{{view="{view}",le="{bound}"}} {count}')
+            lines.append(f'{name}_sum{{view="{view}"}} {series[-2]}')
+            lines.append(f'{name}_count{{view="{view}"}} {series[-1]}')
+    # Without a shared cache the token cache is off and its counters
+    # would only be this worker's.
+    token_stats = token_cache_stats() if cache_is_shared() else {}
+    for name, value in token_stats.items():
+        metric = f'foodgram_token_cache_{name}_total'
+        lines += [f'# TYPE {metric} counter', f'{metric} {value}']
+    return '\n'.join(lines) + '\n'
+
+
+def metrics(request):
+    return HttpResponse(render(registry.collect()), content_type=CONTENT_TYPE)
+
+
+# RecipeViewSet.list, APIDownload.get; plain Django views by function name.
+def view_name(view_func, method):
+    view = getattr(view_func, 'cls', None)
+    if view is None:
+        return getattr(view_func, '__name__', 'unknown')
+    method = method.lower()
+    actions = getattr(view_func, 'actions', None) or {}
+    return f'{view.__name__}.{actions.get(method, method)}'
+
+
+# Adds the time spent inside to the request's serializer time; nested
+# uses are part of the outermost one.
+@contextmanager
+def serializing():
+    timings = getattr(_state, 'timings', None)
+    if timings is None or timings['depth']:
+        yield
+        return
+    timings['depth'] += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings['serializer'] += time.perf_counter() - started
+        timings['depth'] -= 1
+
+
+class TimedRepresentationMixin:
+
+    def to_representation(self, instance):
+        with serializing():
+            return super().to_representation(instance)
+
+
+class TimedModelSerializer(TimedRepresentationMixin,
+                           serializers.ModelSerializer):
+    pass
+
+
+class MetricsMiddleware:
+    # Measures every request: total time, SQL queries and their time on
+    # all databases, and serializer time. The numbers go to the
+    # Server-Timing header and, per view, to the /metrics histograms.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = {'queries': 0, 'db': 0, 'serializer': 0, 'depth': 0}
+        _state.timings = timings
+        _state.view = 'unresolved'
+
+        def execute(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                timings['db'] += time.perf_counter() - started
+                timings['queries'] += 1
+
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(
+                        connections[alias].execute_wrapper(execute))
+                response = self.get_response(request)
+        finally:
+            _state.timings = None
+        total = time.perf_counter() - started
+        response['Server-Timing'] = ', '.join((
+            'db;dur={:.1f};desc="{} queries"'.format(
+                timings['db'] * 1000, timings['queries']),
+            'serializer;dur={:.1f}'.format(timings['serializer'] * 1000),
+            'total;dur={:.1f}'.format(total * 1000)))
+        registry.observe(_state.view, {
+            'foodgram_request_duration_seconds': total,
+            'foodgram_request_db_seconds': timings['db'],
+            'foodgram_request_serializer_seconds': timings['serializer'],
+            'foodgram_request_queries': timings['queries'],
+        })
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        _state.view = view_name(view_func, request.method)
+        return None
@@ -0,0 +1,146 @@
+import logging
+import os
+import random
+import re
+import sys
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from rest_framework import serializers
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+LISTS = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+SPACES = re.compile(r'\s+')
+# Transaction bookkeeping repeats by design.
+IGNORED = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+# Modules whose execute wrappers sit between the query and its caller.
+WRAPPERS = (__file__, metrics.__file__)
+
+
+class RepeatedQueryError(Exception):
+    pass
+
+
+def fingerprint(sql):
+    sql = LITERALS.sub('?', sql)
+    return SPACES.sub(' ', LISTS.sub('(...)', sql)).strip()
+
+
+def origin():
+    # The innermost serializer field being rendered, e.g.
+    # CustomUserSerializer.is_subscribed, and the closest project code.
+    field = location = None
+    frame = sys._getframe(2)
+    while frame is not None and (field is None or location is None):
+        owner = frame.f_locals.get('self')
+        if (field is None and isinstance(owner, serializers.Field)
+                and owner.field_name and owner.parent is not None):
+            field = f'{type(owner.parent).__name__}.{owner.field_name}'
+        path = frame.f_code.co_filename
+        if (location is None and path.startswith(settings.BASE_DIR)
+                and path not in WRAPPERS):
+            location = '{}:{}'.format(
+                os.path.relpath(path, settings.BASE_DIR), frame.f_lineno)
+        frame = frame.f_back
+    return field, location
+
+
+# Counts the statements run on all databases by their SQL with the
+# literals and IN lists stripped. A statement repeated more than
+# QUERY_REPEAT_THRESHOLD times is almost always a query per object of a
+# list; with raising=True the repetition that crosses the threshold
+# raises RepeatedQueryError, otherwise report() logs the offenders. The
+# counts add up over all the watching() blocks of one detector.
+class RepeatedQueries:
+
+    def __init__(self, name, raising):
+        self.name = name
+        self.raising = raising
+        self.counts = Counter()
+        self.origins = {}
+        self.threshold = settings.QUERY_REPEAT_THRESHOLD
+
+    def execute(self, execute, sql, params, many, context):
+        if not sql.lstrip().upper().startswith(IGNORED):
+            key = fingerprint(sql)
+            self.counts[key] += 1
+            if self.counts[key] == self.threshold + 1:
+                self.origins[key] = origin()
+                if self.raising:
+                    raise RepeatedQueryError(
+                        message(self.name, key, self.origins[key]))
+        return execute(sql, params, many, context)
+
+    # execute_wrapper() pops the last wrapper on exit, so blocks of
+    # different wrappers must nest; a streamed body gets a block of its
+    # own instead of keeping the one of the view open.
+    @contextmanager
+    def watching(self):
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(self.execute))
+            yield
+
+    def report(self):
+        if self.raising:
+            return
+        for key, (field, location) in self.origins.items():
+            logger.warning(
+                '%s: запрос выполнен %s раз, поле %s, %s: %s', self.name,
+                self.counts[key], field, location, key)
+
+
+@contextmanager
+def detect_repeated_queries(name, raising):
+    repeated = RepeatedQueries(name, raising)
+    with repeated.watching():
+        yield
+    repeated.report()
+
+
+def message(name, key, origin):
+    field, location = origin
+    return (f'{name}: запрос повторён больше '
+            f'{settings.QUERY_REPEAT_THRESHOLD} раз, поле {field}, '
+            f'{location}: {key}')
+
+
+class QueryRepeatMiddleware:
+    # QUERY_REPEAT_MODE: 'raise' (the default under pytest) checks every
+    # request and fails it, 'log' checks QUERY_REPEAT_SAMPLE_RATE of the
+    # requests and logs, 'off' does nothing. A streamed body is checked
+    # until it has been sent.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = settings.QUERY_REPEAT_MODE
+        if mode == 'off' or (
+                mode == 'log'
+                and random.random() >= settings.QUERY_REPEAT_SAMPLE_RATE):
+            return self.get_response(request)
+        repeated = RepeatedQueries(
+            f'{request.method} {request.path}', mode == 'raise')
+        with repeated.watching():
+            response = self.get_response(request)
+        if not response.streaming:
+            repeated.report()
+            return response
+        # The shopping list download queries while it streams.
+        response.streaming_content = streamed(
+            response.streaming_content, repeated)
+        return response
+
+
+def streamed(content, repeated):
+    with repeated.watching():
+        yield from content
+    repeated.report()
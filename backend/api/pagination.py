@@ -1,5 +1,151 @@
+import base64
+import binascii
+import hashlib
+from collections import OrderedDict
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .cache import namespace_versions, user_namespace
+from .feed import timeline
+from .replicas import primary
+
+COUNT_KEY = 'api:count:{}'
+
+
+# The count is stored under the SQL of the query and the versions of the
+# namespaces it depends on, so it survives until one of them is bumped or
+# PAGINATION_COUNT_TIMEOUT expires.
+class CachedCountPaginator(Paginator):
+
+    def __init__(self, *args, namespaces=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.namespaces = namespaces
+
+    @cached_property
+    def count(self):
+        if self.namespaces is None:
+            return super().count
+        try:
+            sql, params = self.object_list.query.sql_with_params()
+        except EmptyResultSet:
+            return super().count
+        raw = repr((sql, params, namespace_versions(self.namespaces)))
+        key = COUNT_KEY.format(hashlib.md5(raw.encode()).hexdigest())
+        count = cache.get(key)
+        if count is None:
+            with primary():
+                count = super().count
+            cache.set(key, count, settings.PAGINATION_COUNT_TIMEOUT)
+        return count
 
 
 class CustomPagination(PageNumberPagination):
     page_size_query_param = 'limit'
+    max_page_size = settings.MAX_PAGE_SIZE
+    django_paginator_class = CachedCountPaginator
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = (
+            self.cursor_query_param in request.query_params
+            and getattr(view, 'cursor_pagination', False))
+        if self.cursor_mode:
+            return self.paginate_cursor(queryset, request)
+        self.django_paginator_class = partial(
+            CachedCountPaginator,
+            namespaces=self.get_count_namespaces(request, view))
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_count_namespaces(self, request, view):
+        if not hasattr(view, 'get_cache_namespaces'):
+            return None
+        namespaces = list(view.get_cache_namespaces())
+        if request.user.is_authenticated:
+            namespaces.append(user_namespace(request.user.id))
+        return namespaces
+
+    # Cursor mode walks the feed by (pub_date, id) instead of OFFSET and
+    # never counts rows; the cursor is the last row of the previous page.
+    def paginate_cursor(self, queryset, request):
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(
+            request.query_params.get(self.cursor_query_param, ''))
+        page = self.cursor_page(queryset, position, page_size + 1)
+        self.next_position = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            last = page[-1]
+            self.next_position = (
+                (last['pub_date'], last['id']) if isinstance(last, dict)
+                else (last.pub_date, last.id))
+        return page
+
+    def cursor_page(self, queryset, position, size):
+        if position is not None:
+            pub_date, pk = position
+            queryset = queryset.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=pk))
+        return list(queryset.order_by('-pub_date', '-id')[:size])
+
+    def decode_cursor(self, value):
+        if not value:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(value.encode()).decode()
+            pub_date, pk = raw.rsplit('|', 1)
+            pub_date = parse_datetime(pub_date)
+            pk = int(pk)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            pub_date = None
+        if pub_date is None:
+            raise NotFound('Неверный курсор.')
+        return pub_date, pk
+
+    def encode_cursor(self, position):
+        pub_date, pk = position
+        raw = f'{pub_date.isoformat()}|{pk}'
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(
+            url, self.cursor_query_param,
+            self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+
+class FeedPagination(CustomPagination):
+    # The feed is always read with a cursor, from the user's timeline.
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = True
+        return self.paginate_cursor(queryset, request)
+
+    def cursor_page(self, queryset, position, size):
+        ids = timeline(self.request.user, position, size)
+        recipes = {row['id']: row for row in queryset.filter(id__in=ids)}
+        return [recipes[pk] for pk in ids if pk in recipes]
@@ -0,0 +1,174 @@
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from foodgram_app.models import Recipe, RecipeChange, RecipeIngredient
+from .cache import bump_namespaces, namespace_versions
+from .replicas import primary
+
+# Changes are logged after commit, so two of them may become visible out
+# of id order; every refresh re-reads the last LOOKBACK entries, which is
+# harmless because applying a change reloads the recipe.
+LOOKBACK = 100
+PRUNE_EVERY = 100
+EMPTY = np.empty(0, dtype=np.int32)
+
+Snapshot = namedtuple('Snapshot', (
+    'version', 'checked', 'position', 'postings', 'needed', 'built',
+    'refreshed', 'applied'))
+
+
+def record_change(pk):
+    change = RecipeChange.objects.create(recipe_id=pk)
+    if change.id % PRUNE_EVERY == 0:
+        RecipeChange.objects.filter(
+            id__lte=change.id - settings.PANTRY_LOG_SIZE).delete()
+    bump_namespaces('pantry')
+
+
+def schedule_change(pk):
+    transaction.on_commit(lambda: record_change(pk))
+
+
+@receiver(post_delete, sender=Recipe)
+def forget_recipe(instance, **kwargs):
+    schedule_change(instance.pk)
+
+
+# Maps every ingredient to the sorted array of the recipes that use it,
+# plus the number of ingredients of every recipe, so that a pantry is
+# matched with one bincount over the postings of its ingredients. Like
+# IngredientIndex it follows the version of a cache namespace, 'pantry';
+# on a change it reads the RecipeChange log and rebuilds only the
+# postings of the changed recipes. Readers keep using the snapshot they
+# started with, a refresh replaces it as a whole.
+class PantryIndex:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def _load(self):
+        version = namespace_versions(['pantry'])[0]
+        snapshot = self._snapshot
+        if (snapshot is not None and snapshot.version == version
+                and time.monotonic() - snapshot.checked
+                < settings.PANTRY_INDEX_MAX_AGE):
+            return snapshot
+        with self._lock, primary():
+            if self._snapshot is snapshot:
+                if snapshot is None:
+                    self._snapshot = self._build(version)
+                else:
+                    self._snapshot = self._refresh(snapshot, version)
+            return self._snapshot
+
+    def _build(self, version):
+        position = RecipeChange.objects.aggregate(
+            position=Max('id'))['position'] or 0
+        rows = np.array(RecipeIngredient.objects.values_list(
+            'ingredient_id', 'recipe_id'), dtype=np.int32).reshape(-1, 2)
+        rows = rows[np.lexsort((rows[:, 1], rows[:, 0]))]
+        ingredients, starts = np.unique(rows[:, 0], return_index=True)
+        recipes = rows[:, 1].copy()
+        postings = dict(zip(ingredients.tolist(), np.split(
+            recipes, starts[1:])))
+        needed = np.bincount(recipes).astype(np.uint16)
+        now = time.monotonic()
+        return Snapshot(version, now, position, postings, needed,
+                        time.time(), time.time(), 0)
+
+    def _refresh(self, snapshot, version):
+        changes = list(RecipeChange.objects.filter(
+            id__gt=snapshot.position - LOOKBACK).order_by('id').values_list(
+            'id', 'recipe_id'))
+        if not changes:
+            return snapshot._replace(
+                version=version, checked=time.monotonic())
+        oldest = RecipeChange.objects.aggregate(oldest=Min('id'))['oldest']
+        if oldest > snapshot.position + 1:
+            # The log has been pruned past us.
+            return self._build(version)
+        recipe_ids = np.array(sorted({pk for _, pk in changes}),
+                              dtype=np.int32)
+        postings = dict(snapshot.postings)
+        for ingredient, posting in snapshot.postings.items():
+            found = np.searchsorted(posting, recipe_ids)
+            inside = found < len(posting)
+            found = found[inside]
+            found = found[posting[found] == recipe_ids[inside]]
+            if len(found):
+                postings[ingredient] = np.delete(posting, found)
+        added = defaultdict(list)
+        needed = snapshot.needed.copy()
+        needed[recipe_ids[recipe_ids < len(needed)]] = 0
+        rows = list(RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids.tolist()).values_list(
+            'ingredient_id', 'recipe_id'))
+        for ingredient, recipe in rows:
+            added[ingredient].append(recipe)
+        if rows:
+            largest = max(recipe for _, recipe in rows)
+            if largest >= len(needed):
+                needed = np.concatenate([needed, np.zeros(
+                    largest + 1 - len(needed), dtype=needed.dtype)])
+            np.add.at(needed, [recipe for _, recipe in rows], 1)
+        for ingredient, recipes in added.items():
+            postings[ingredient] = np.union1d(
+                postings.get(ingredient, EMPTY),
+                np.array(recipes, dtype=np.int32))
+        return snapshot._replace(
+            version=version, checked=time.monotonic(),
+            position=max(snapshot.position, changes[-1][0]),
+            postings=postings, needed=needed, refreshed=time.time(),
+            applied=snapshot.applied + len(recipe_ids))
+
+    # Recipes that use at least one of the ingredients and lack at most
+    # missing of their own, as (recipe id, share of its ingredients the
+    # user has, number lacking), best covered first.
+    def search(self, ingredient_ids, missing, limit):
+        snapshot = self._load()
+        postings = [
+            snapshot.postings[pk] for pk in set(ingredient_ids)
+            if pk in snapshot.postings]
+        if not postings:
+            return []
+        matched = np.bincount(np.concatenate(postings))
+        recipes = np.flatnonzero(matched)
+        matched = matched[recipes]
+        needed = snapshot.needed[recipes].astype(np.int64)
+        lacking = needed - matched
+        fits = lacking <= missing
+        recipes, matched, needed, lacking = (
+            recipes[fits], matched[fits], needed[fits], lacking[fits])
+        coverage = matched / needed
+        order = np.lexsort((-recipes, lacking, -coverage))[:limit]
+        return [
+            (int(recipes[index]), round(float(coverage[index]), 3),
+             int(lacking[index]))
+            for index in order]
+
+    def stats(self):
+        snapshot = self._load()
+        postings = snapshot.postings.values()
+        return {
+            'ingredients': len(snapshot.postings),
+            'recipes': int(np.count_nonzero(snapshot.needed)),
+            'postings': sum(len(posting) for posting in postings),
+            'memory_bytes': snapshot.needed.nbytes + sum(
+                posting.nbytes for posting in postings),
+            'log_position': snapshot.position,
+            'changes_applied': snapshot.applied,
+            'built_at': snapshot.built,
+            'refreshed_at': snapshot.refreshed,
+        }
+
+
+pantry_index = PantryIndex()
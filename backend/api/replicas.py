@@ -0,0 +1,98 @@
+import hashlib
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+
+STICKY_KEY = 'api:sticky:{}'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Read from the primary even on replica requests: a token issued by
+# token/login/ must authenticate the very next request.
+PRIMARY_MODELS = ('authtoken.token', 'users.customuser')
+
+_state = threading.local()
+
+
+def client_key(request):
+    credentials = request.META.get('HTTP_AUTHORIZATION')
+    if not credentials:
+        return None
+    return STICKY_KEY.format(hashlib.md5(credentials.encode()).hexdigest())
+
+
+# Reads inside go to the primary. Whatever is kept beyond the request
+# (cached responses and counts, in-memory indexes) is built this way,
+# otherwise a lagging replica could store a state older than the write
+# that has just invalidated it, for everybody until the next bump.
+@contextmanager
+def primary():
+    database = getattr(_state, 'database', None)
+    _state.database = None
+    try:
+        yield
+    finally:
+        _state.database = database
+
+
+class ReplicaRouter:
+    # Reads go to the replica chosen by ReplicaMiddleware for the current
+    # request, everything else to the primary.
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower in PRIMARY_MODELS:
+            return None
+        return getattr(_state, 'database', None)
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaMiddleware:
+    # Safe requests to views with replica_reads = True read from a random
+    # replica. A client that has just written sticks to the primary for
+    # REPLICA_STICKY_SECONDS so that it always sees its own changes;
+    # clients are told apart by their Authorization header, and the mark
+    # lives in the cache, so replicas are refused without a shared one.
+
+    def __init__(self, get_response):
+        # api.cache imports this module.
+        from .cache import cache_is_shared
+
+        if settings.DATABASE_REPLICAS and not cache_is_shared():
+            raise ImproperlyConfigured(
+                'DB_REPLICAS needs a CACHE_BACKEND shared by all workers: '
+                'with a per-process cache a client that has written may '
+                'read from a lagging replica in another worker.')
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.database = None
+        if request.method not in SAFE_METHODS:
+            key = client_key(request)
+            if key is not None:
+                cache.set(key, True, settings.REPLICA_STICKY_SECONDS)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'cls', None)
+        if (not settings.DATABASE_REPLICAS
+                or request.method not in SAFE_METHODS
+                or not getattr(view, 'replica_reads', False)):
+            return None
+        key = client_key(request)
+        if key is not None and cache.get(key):
+            return None
+        _state.database = random.choice(settings.DATABASE_REPLICAS)
+        return None
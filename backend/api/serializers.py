@@ -1,13 +1,23 @@
+from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
 
 from foodgram_app.models import (Favorite, Follow, Ingredient, Purchase,
-                                 Recipe, RecipeIngredient, Tag)
+                                 Recipe, RecipeIngredient, ShoppingListItem,
+                                 Tag)
 from users.models import CustomUser
+from .feed import schedule_fan_out
 from .fields import Base64ImageField
-from .utils import ingredients_create
+from .metrics import TimedModelSerializer
+from .pantry import schedule_change
+from .shopping_list import lock_recipes, recipe_changed
+from .similar import index_recipe
+from .utils import (attach_short_recipes, authors_for_user,
+                    ingredients_create, ingredients_update, parse_limit,
+                    recipes_for_user)
 
 
-class CustomUserSerializer(serializers.ModelSerializer):
+class CustomUserSerializer(TimedModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
@@ -18,27 +28,29 @@ class CustomUserSerializer(serializers.ModelSerializer):
         ordering = ['-id']
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
         return Follow.objects.filter(user=request.user, author=obj).exists()
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedModelSerializer):
 
     class Meta:
         model = Tag
         fields = '__all__'
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedModelSerializer):
 
     class Meta:
         model = Ingredient
         fields = '__all__'
 
 
-class IngredientListSerializer(serializers.ModelSerializer):
+class IngredientListSerializer(TimedModelSerializer):
     id = serializers.ReadOnlyField(source='ingredient.id')
     name = serializers.ReadOnlyField(source='ingredient.name')
     measurement_unit = serializers.ReadOnlyField(
@@ -49,8 +61,8 @@ class IngredientListSerializer(serializers.ModelSerializer):
         model = RecipeIngredient
 
 
-class RecipeIngredientsSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+class RecipeIngredientsSerializer(TimedModelSerializer):
+    id = serializers.IntegerField()
     amount = serializers.IntegerField()
 
     class Meta:
@@ -58,7 +70,7 @@ class RecipeIngredientsSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class RecipeReadSerializer(TimedModelSerializer):
     author = CustomUserSerializer(read_only=True)
     tags = TagSerializer(read_only=True, many=True)
     ingredients = serializers.SerializerMethodField(read_only=True)
@@ -68,27 +80,32 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     class Meta:
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time')
+            'is_in_shopping_cart', 'name', 'image', 'image_webp',
+            'image_thumbnail', 'text', 'cooking_time')
         model = Recipe
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
         return Favorite.objects.filter(user=request.user, recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
         return Purchase.objects.filter(user=request.user, recipe=obj).exists()
 
     def get_ingredients(self, obj):
-        queryset = RecipeIngredient.objects.filter(recipe=obj)
-        return IngredientListSerializer(queryset, many=True).data
+        return IngredientListSerializer(
+            obj.ingredients_amounts.all(), many=True).data
 
 
-class RecipeWriteSerializer(serializers.ModelSerializer):
+class RecipeWriteSerializer(TimedModelSerializer):
     tags = serializers.PrimaryKeyRelatedField(
         many=True, queryset=Tag.objects.all())
     ingredients = RecipeIngredientsSerializer(many=True)
@@ -100,29 +117,46 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                   'image', 'name', 'text', 'cooking_time')
         model = Recipe
 
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context.get('request').user
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(**validated_data, author=author)
         ingredients_create(ingredients, recipe)
-        for tag in tags:
-            recipe.tags.add(tag)
+        index_recipe(recipe.id, [item['id'] for item in ingredients])
+        schedule_change(recipe.id)
+        recipe.tags.set(tags)
+        schedule_fan_out(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags_data = validated_data.pop('tags')
         instance.tags.set(tags_data)
-        RecipeIngredient.objects.filter(recipe=instance).all().delete()
         ingredients = validated_data.pop('ingredients')
-        ingredients_create(ingredients, instance)
+        lock_recipes([instance.pk])
+        recipe_changed(instance, ingredients_update(ingredients, instance))
+        index_recipe(instance.id, [item['id'] for item in ingredients])
+        schedule_change(instance.id)
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
         request = self.context.get('request')
         context = {'request': request}
+        instance = recipes_for_user(request.user).get(pk=instance.pk)
         return RecipeReadSerializer(instance, context=context).data
 
+    def validate_ingredients(self, ingredients):
+        ids = {ingredient['id'] for ingredient in ingredients}
+        missing = ids - set(Ingredient.objects.filter(
+            id__in=ids).values_list('id', flat=True))
+        if missing:
+            raise serializers.ValidationError(
+                'Ингредиенты не найдены: '
+                f'{", ".join(map(str, sorted(missing)))}.')
+        return ingredients
+
     def validate(self, data):
         ingredients = data['ingredients']
         unique_ingredients = []
@@ -141,7 +175,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         return data
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
+class FavoriteSerializer(TimedModelSerializer):
     image = serializers.ImageField(read_only=True, source='recipe.image')
     name = serializers.CharField(read_only=True, source='recipe.name')
     id = serializers.IntegerField(read_only=True, source='recipe.id')
@@ -154,14 +188,30 @@ class FavoriteSerializer(serializers.ModelSerializer):
         model = Favorite
 
 
-class ShortRecipeSerializer(serializers.ModelSerializer):
+class ShortRecipeSerializer(TimedModelSerializer):
 
     class Meta:
-        fields = ('id', 'name', 'cooking_time', 'image')
+        fields = ('id', 'name', 'cooking_time', 'image', 'image_webp',
+                  'image_thumbnail')
         model = Recipe
 
 
-class ShoppingCartSerializer(serializers.ModelSerializer):
+class SimilarRecipeSerializer(ShortRecipeSerializer):
+    similarity = serializers.FloatField(read_only=True)
+
+    class Meta(ShortRecipeSerializer.Meta):
+        fields = ShortRecipeSerializer.Meta.fields + ('similarity', )
+
+
+class PantryRecipeSerializer(ShortRecipeSerializer):
+    coverage = serializers.FloatField(read_only=True)
+    missing = serializers.IntegerField(read_only=True)
+
+    class Meta(ShortRecipeSerializer.Meta):
+        fields = ShortRecipeSerializer.Meta.fields + ('coverage', 'missing')
+
+
+class ShoppingCartSerializer(TimedModelSerializer):
     image = serializers.ImageField(read_only=True, source='recipe.image')
     name = serializers.CharField(read_only=True, source='recipe.name')
     id = serializers.IntegerField(read_only=True, source='recipe.id')
@@ -174,7 +224,7 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         model = Purchase
 
 
-class FollowWriteSerializer(serializers.ModelSerializer):
+class FollowWriteSerializer(TimedModelSerializer):
 
     class Meta:
         model = Follow
@@ -191,7 +241,8 @@ class FollowWriteSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         request = self.context.get('request')
         context = {'request': request}
-        return FollowListSerializer(instance.author, context=context).data
+        author = authors_for_user(request.user).get(pk=instance.author_id)
+        return FollowListSerializer(author, context=context).data
 
     def validate(self, attrs):
         user = attrs['user']
@@ -201,10 +252,10 @@ class FollowWriteSerializer(serializers.ModelSerializer):
         return attrs
 
 
-class FollowListSerializer(serializers.ModelSerializer):
+class FollowListSerializer(TimedModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.ReadOnlyField(source='recipes.count')
+    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         fields = ('email', 'id', 'username', 'first_name',
@@ -213,20 +264,54 @@ class FollowListSerializer(serializers.ModelSerializer):
         model = CustomUser
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
         return Follow.objects.filter(user=request.user, author=obj).exists()
 
+    def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
+        return obj.recipes.count()
+
     def get_recipes(self, obj):
         request = self.context.get('request')
         context = {'request': request}
-        if request and request.user.is_authenticated:
-            recipes_limit = request.query_params.get('recipes_limit')
-            if recipes_limit is not None:
-                queryset = obj.recipes.all()[:int(recipes_limit)]
-            else:
-                queryset = Recipe.objects.filter(author=obj)
-        else:
-            queryset = Recipe.objects.filter(author=obj)
-        return ShortRecipeSerializer(queryset, many=True, context=context).data
+        if not hasattr(obj, 'short_recipes'):
+            attach_short_recipes([obj], parse_limit(
+                request.query_params.get('recipes_limit')) if request
+                else None)
+        return ShortRecipeSerializer(
+            obj.short_recipes, many=True, context=context).data
+
+
+class ShoppingListItemSerializer(TimedModelSerializer):
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit')
+    amount = serializers.ReadOnlyField(source='quantity')
+
+    class Meta:
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+        model = ShoppingListItem
+
+
+class BatchSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False,
+        max_length=settings.BATCH_MAX_SIZE, error_messages={
+            'max_length': 'Не больше {max_length} элементов за раз.'})
+
+    def validate_ids(self, ids):
+        return list(dict.fromkeys(ids))
+
+
+class PantrySerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False,
+        max_length=settings.BATCH_MAX_SIZE, error_messages={
+            'max_length': 'Не больше {max_length} элементов за раз.'})
+    missing = serializers.IntegerField(min_value=0, default=0)
@@ -0,0 +1,235 @@
+import csv
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Case, F, Sum, Value, When
+from django.db.models.functions import Greatest
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from foodgram_app.models import (Purchase, Recipe, RecipeIngredient,
+                                 ShoppingListItem)
+from users.models import CustomUser
+
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen.canvas import Canvas
+except ImportError:
+    Canvas = None
+
+CHUNK_SIZE = 64 * 1024
+FIELDS = ('name', 'measurement_unit', 'amount')
+REBUILD_BATCH_SIZE = 500
+
+
+def shopping_list(user):
+    return ShoppingListItem.objects.filter(user=user).values(
+        'ingredient__name', 'ingredient__measurement_unit',
+        'quantity').order_by(
+        'ingredient__name', 'ingredient__measurement_unit').iterator()
+
+
+# Every shopping list is kept as (user, ingredient) -> quantity rows that
+# are changed by deltas when a recipe enters or leaves a cart and when a
+# recipe in someone's cart changes its ingredients. Callers run inside a
+# transaction; recipe rows are locked before user rows, both in id order,
+# so that concurrent changes of one list are applied one after another.
+# Changes made behind the API's back (the admin, raw SQL) are repaired by
+# the rebuild_shopping_lists command.
+def lock_recipes(recipe_ids):
+    return list(Recipe.objects.select_for_update().filter(
+        id__in=recipe_ids).order_by('id').values_list('id', flat=True))
+
+
+def lock_users(user_ids):
+    return list(CustomUser.objects.select_for_update().filter(
+        id__in=user_ids).order_by('id').values_list('id', flat=True))
+
+
+def apply_deltas(user_ids, deltas):
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas or not user_ids:
+        return
+    user_ids = lock_users(user_ids)
+    items = ShoppingListItem.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=deltas)
+    existing = set(items.values_list('user_id', 'ingredient_id'))
+    if existing:
+        change = Case(
+            *(When(ingredient_id=pk, then=Value(delta))
+              for pk, delta in deltas.items()),
+            output_field=models.PositiveIntegerField())
+        items.update(quantity=Greatest(F('quantity') + change, Value(0)))
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(user_id=user_id, ingredient_id=pk, quantity=delta)
+        for user_id in user_ids for pk, delta in deltas.items()
+        if delta > 0 and (user_id, pk) not in existing)
+    if existing and min(deltas.values()) < 0:
+        items.filter(quantity=0).delete()
+
+
+def cart_changed(user, recipe_ids, sign):
+    totals = RecipeIngredient.objects.filter(
+        recipe_id__in=lock_recipes(recipe_ids)).order_by().values(
+        'ingredient').annotate(total=Sum('amount')).values_list(
+        'ingredient', 'total')
+    apply_deltas([user.id], {pk: sign * total for pk, total in totals})
+
+
+def add_to_shopping_list(user, recipe_ids):
+    cart_changed(user, recipe_ids, 1)
+
+
+def remove_from_shopping_list(user, recipe_ids):
+    cart_changed(user, recipe_ids, -1)
+
+
+def purchasers(recipe):
+    return list(Purchase.objects.filter(recipe=recipe).values_list(
+        'user_id', flat=True))
+
+
+# deltas maps ingredient ids to the change of their amount in the recipe;
+# the recipe has to be locked with lock_recipes() before it was read.
+def recipe_changed(recipe, deltas):
+    if any(deltas.values()):
+        apply_deltas(purchasers(recipe), deltas)
+
+
+@receiver(pre_delete, sender=Recipe)
+def forget_recipe(instance, **kwargs):
+    # The cascade will drop the purchases without telling anyone.
+    lock_recipes([instance.pk])
+    user_ids = purchasers(instance)
+    if user_ids:
+        apply_deltas(user_ids, {
+            pk: -amount for pk, amount in
+            instance.ingredients_amounts.values_list(
+                'ingredient_id', 'amount')})
+
+
+def rebuild_shopping_lists():
+    created = updated = deleted = 0
+    user_ids = list(CustomUser.objects.order_by('id').values_list(
+        'id', flat=True))
+    for start in range(0, len(user_ids), REBUILD_BATCH_SIZE):
+        with transaction.atomic():
+            batch = lock_users(user_ids[start:start + REBUILD_BATCH_SIZE])
+            expected = {
+                (item['recipe__purchased_by__user'], item['ingredient']):
+                    item['total']
+                for item in RecipeIngredient.objects.filter(
+                    recipe__purchased_by__user__in=batch).values(
+                    'recipe__purchased_by__user', 'ingredient').annotate(
+                    total=Sum('amount')).order_by()}
+            current = {
+                (item.user_id, item.ingredient_id): item
+                for item in ShoppingListItem.objects.filter(
+                    user_id__in=batch)}
+            stale = [
+                item.id for key, item in current.items()
+                if key not in expected]
+            changed = []
+            for key, item in current.items():
+                if key in expected and item.quantity != expected[key]:
+                    item.quantity = expected[key]
+                    changed.append(item)
+            new = [
+                ShoppingListItem(
+                    user_id=user_id, ingredient_id=pk, quantity=quantity)
+                for (user_id, pk), quantity in expected.items()
+                if (user_id, pk) not in current]
+            ShoppingListItem.objects.filter(id__in=stale).delete()
+            ShoppingListItem.objects.bulk_update(changed, ['quantity'])
+            ShoppingListItem.objects.bulk_create(new)
+        created += len(new)
+        updated += len(changed)
+        deleted += len(stale)
+    return created, updated, deleted
+
+
+def rows(items):
+    for elem in items:
+        yield (elem['ingredient__name'],
+               elem['ingredient__measurement_unit'],
+               elem['quantity'])
+
+
+def write_txt(items):
+    separator = ''
+    for name, unit, quantity in rows(items):
+        yield f'{separator}{name} ({unit}) — {quantity}'
+        separator = '\n'
+
+
+class Echo:
+
+    def write(self, value):
+        return value
+
+
+def write_csv(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(FIELDS)
+    for row in rows(items):
+        yield writer.writerow(row)
+
+
+def write_json(items):
+    separator = ''
+    yield '['
+    for row in rows(items):
+        yield separator + json.dumps(dict(zip(FIELDS, row)),
+                                     ensure_ascii=False)
+        separator = ', '
+    yield ']'
+
+
+def pdf_font():
+    path = settings.SHOPPING_LIST_PDF_FONT
+    if not os.path.exists(path):
+        return 'Helvetica'
+    if 'ShoppingList' not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont('ShoppingList', path))
+    return 'ShoppingList'
+
+
+# reportlab can only write a finished document, so the PDF is rendered
+# into a spooled temporary file and then streamed from it in chunks.
+def write_pdf(items):
+    font = pdf_font()
+    _, height = A4
+    margin = 50
+    line_height = 18
+    with tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE * 16) as file:
+        canvas = Canvas(file, pagesize=A4)
+        canvas.setTitle('Список покупок')
+        canvas.setFont(font, 16)
+        canvas.drawString(margin, height - margin, 'Список покупок')
+        canvas.setFont(font, 12)
+        position = height - margin - 2 * line_height
+        for line in write_txt(items):
+            if position < margin:
+                canvas.showPage()
+                canvas.setFont(font, 12)
+                position = height - margin
+            canvas.drawString(margin, position, line.strip())
+            position -= line_height
+        canvas.save()
+        file.seek(0)
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            yield chunk
+
+
+FORMATS = {
+    'txt': ('text/plain', write_txt),
+    'csv': ('text/csv; charset=utf-8', write_csv),
+    'json': ('application/json', write_json),
+}
+if Canvas is not None:
+    FORMATS['pdf'] = ('application/pdf', write_pdf)
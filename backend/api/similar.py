@@ -0,0 +1,158 @@
+import numpy as np
+from django.db import connection, connections, router, transaction
+
+from foodgram_app.models import (Ingredient, Recipe, RecipeBucket,
+                                 RecipeIngredient, RecipeSignature)
+
+# A recipe is described by a MinHash signature of its set of ingredients:
+# the minimum of each of PERMUTATIONS hash functions over the ingredient
+# ids. The share of equal positions in two signatures estimates the
+# Jaccard similarity of the sets. For the lookup the signature is cut
+# into BANDS bands of ROWS values and every band is hashed into a
+# bucket; recipes sharing a bucket in any band are the candidates, so
+# pairs with a similarity around (1 / BANDS) ** (1 / ROWS) = 0.5 and
+# above are found without comparing every pair. Changing any of these
+# numbers requires running rebuild_similar_index.
+PERMUTATIONS = 64
+BANDS = 16
+ROWS = PERMUTATIONS // BANDS
+PRIME = (1 << 31) - 1
+MAX_CANDIDATES = 200
+REBUILD_BATCH_SIZE = 10000
+INSERT_BATCH_SIZE = 300
+SIGNATURE_TABLE = RecipeSignature._meta.db_table
+BUCKET_TABLE = RecipeBucket._meta.db_table
+
+_random = np.random.RandomState(20261018)
+COEFFICIENTS = _random.randint(1, PRIME, size=(PERMUTATIONS, 1),
+                               dtype=np.int64)
+OFFSETS = _random.randint(0, PRIME, size=(PERMUTATIONS, 1), dtype=np.int64)
+BAND_WEIGHTS = _random.randint(
+    1, np.iinfo(np.int64).max, size=ROWS, dtype=np.int64).astype(
+    np.uint64) | np.uint64(1)
+
+
+def hashes(ingredient_ids):
+    # One column of PERMUTATIONS hashes per ingredient; the products stay
+    # below 2 ** 62, so int64 does not overflow.
+    ids = np.asarray(ingredient_ids, dtype=np.int64).reshape(1, -1)
+    return ((COEFFICIENTS * ids + OFFSETS) % PRIME).astype(np.uint32)
+
+
+def buckets(signatures):
+    # Rows of signatures in, one bucket per band out; uint64 arithmetic
+    # wraps around, which is fine for a hash.
+    bands = signatures.astype(np.uint64).reshape(-1, BANDS, ROWS)
+    return (bands * BAND_WEIGHTS).sum(axis=2, dtype=np.uint64).view(
+        np.int64)
+
+
+def to_signature(value):
+    return np.frombuffer(bytes(value), dtype='<u4')
+
+
+def insert(table, columns, rows):
+    # bulk_create() spends most of its time building model instances;
+    # the index has millions of rows, so they go in as plain VALUES lists.
+    placeholders = '({})'.format(', '.join(['%s'] * len(columns)))
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            batch = rows[start:start + INSERT_BATCH_SIZE]
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(columns)}) VALUES '
+                + ', '.join([placeholders] * len(batch)),
+                [value for row in batch for value in row])
+
+
+def store(recipe_ids, signatures):
+    insert(SIGNATURE_TABLE, ('recipe_id', 'signature'), [
+        (pk, signature.astype('<u4').tobytes())
+        for pk, signature in zip(recipe_ids, signatures)])
+    insert(BUCKET_TABLE, ('recipe_id', 'band', 'bucket'), [
+        (pk, band, bucket)
+        for pk, row in zip(recipe_ids, buckets(signatures).tolist())
+        for band, bucket in enumerate(row)])
+
+
+def index_recipe(pk, ingredient_ids):
+    signature = (hashes(ingredient_ids).min(axis=1) if ingredient_ids
+                 else None)
+    stored = RecipeSignature.objects.filter(recipe_id=pk).values_list(
+        'signature', flat=True).first()
+    if stored is None and signature is None:
+        return
+    if (stored is not None and signature is not None
+            and np.array_equal(to_signature(stored), signature)):
+        return
+    if stored is not None:
+        RecipeSignature.objects.filter(recipe_id=pk).delete()
+        RecipeBucket.objects.filter(recipe_id=pk).delete()
+    if signature is not None:
+        store([pk], signature.reshape(1, -1))
+
+
+# Returns {recipe id: estimated similarity}, most similar first. The
+# lookup runs on every request and building the OR of BANDS conditions
+# through the ORM took longer than the queries themselves, so it is SQL.
+def similar_recipes(pk, limit):
+    using = router.db_for_read(RecipeBucket)
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'SELECT signature FROM {SIGNATURE_TABLE} WHERE recipe_id = %s',
+            (pk, ))
+        row = cursor.fetchone()
+        if row is None:
+            return {}
+        signature = to_signature(row[0])
+        params = []
+        for band, bucket in enumerate(
+                buckets(signature.reshape(1, -1))[0].tolist()):
+            params += (band, bucket)
+        # Recipes sharing more bands are likely to be more similar, so
+        # only the best of them have their signatures compared.
+        cursor.execute(
+            f'SELECT candidates.recipe_id, signatures.signature FROM ('
+            f'SELECT recipe_id, COUNT(*) AS bands FROM {BUCKET_TABLE} '
+            'WHERE (' + ' OR '.join(['(band = %s AND bucket = %s)'] * BANDS)
+            + ') AND recipe_id <> %s GROUP BY recipe_id '
+            'ORDER BY bands DESC, recipe_id DESC LIMIT %s) candidates '
+            f'JOIN {SIGNATURE_TABLE} signatures '
+            'ON signatures.recipe_id = candidates.recipe_id',
+            params + [pk, MAX_CANDIDATES])
+        rows = cursor.fetchall()
+    if not rows:
+        return {}
+    scores = (np.vstack([to_signature(value) for _, value in rows])
+              == signature).mean(axis=1)
+    best = sorted(zip(scores.tolist(), [pk for pk, _ in rows]),
+                  reverse=True)[:limit]
+    return {pk: round(score, 3) for score, pk in best}
+
+
+def rebuild_similar_index():
+    indexed = 0
+    with transaction.atomic():
+        ingredients = np.array(sorted(Ingredient.objects.values_list(
+            'id', flat=True)), dtype=np.int64)
+        table = hashes(ingredients)
+        RecipeBucket.objects.all().delete()
+        RecipeSignature.objects.all().delete()
+        last = 0
+        while True:
+            batch = list(Recipe.objects.filter(id__gt=last).order_by(
+                'id').values_list('id', flat=True)[:REBUILD_BATCH_SIZE])
+            if not batch:
+                break
+            last = batch[-1]
+            rows = np.array(RecipeIngredient.objects.filter(
+                recipe_id__gte=batch[0], recipe_id__lte=last).order_by(
+                'recipe_id').values_list('recipe_id', 'ingredient_id'),
+                dtype=np.int64).reshape(-1, 2)
+            if not len(rows):
+                continue
+            recipe_ids, starts = np.unique(rows[:, 0], return_index=True)
+            columns = table[:, np.searchsorted(ingredients, rows[:, 1])]
+            signatures = np.minimum.reduceat(columns, starts, axis=1).T
+            store(recipe_ids.tolist(), signatures)
+            indexed += len(recipe_ids)
+    return indexed
@@ -0,0 +1,73 @@
+import pytest
+from django.core.cache import cache
+from rest_framework.test import APIClient
+
+from foodgram_app.models import Ingredient, Recipe, RecipeIngredient, Tag
+from users.models import CustomUser
+
+
+@pytest.fixture(autouse=True)
+def clean_cache(settings, tmp_path):
+    # Tests roll their transactions back, so the on_commit hooks that
+    # bump cache namespaces never run; start every test from scratch.
+    settings.MEDIA_ROOT = str(tmp_path)
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def author(db):
+    return CustomUser.objects.create_user(
+        email='author@example.com', username='author', password='password')
+
+
+@pytest.fixture
+def user(db):
+    return CustomUser.objects.create_user(
+        email='user@example.com', username='user', password='password')
+
+
+@pytest.fixture
+def client():
+    return APIClient()
+
+
+@pytest.fixture
+def user_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def author_client(author):
+    client = APIClient()
+    client.force_authenticate(author)
+    return client
+
+
+@pytest.fixture
+def tag(db):
+    return Tag.objects.create(name='Завтрак', color='#E26C2D', slug='breakfast')
+
+
+@pytest.fixture
+def ingredients(db):
+    return [
+        Ingredient.objects.create(name=f'Продукт {index}',
+                                  measurement_unit='г')
+        for index in range(8)]
+
+
+@pytest.fixture
+def make_recipe(author):
+    def make_recipe(name='Рецепт', text='Описание', ingredients=()):
+        recipe = Recipe.objects.create(
+            author=author, name=name, text=text, cooking_time=10,
+            image='recipe.png')
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients)
+        return recipe
+    return make_recipe
@@ -0,0 +1,19 @@
+import pytest
+from django.db import connection
+
+from api.nplusone import RepeatedQueryError
+
+
+def test_streamed_body_is_checked(settings, user_client):
+    settings.QUERY_REPEAT_THRESHOLD = 0
+    response = user_client.get('/api/recipes/download_shopping_cart/')
+    assert response.status_code == 200
+    with pytest.raises(RepeatedQueryError, match='shopping_list.py'):
+        b''.join(response.streaming_content)
+    assert connection.execute_wrappers == []
+
+
+def test_streamed_body_within_threshold(user_client):
+    response = user_client.get('/api/recipes/download_shopping_cart/')
+    assert b''.join(response.streaming_content) == b''
+    assert connection.execute_wrappers == []
@@ -0,0 +1,70 @@
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from django.utils import timezone
+
+from api.pagination import CustomPagination
+from foodgram_app.models import Recipe
+
+
+@pytest.fixture
+def recipes(make_recipe):
+    recipes = [make_recipe(name=f'Рецепт {index}') for index in range(7)]
+    # Ties on pub_date are broken by id.
+    Recipe.objects.filter(id__in=[recipe.id for recipe in recipes[2:5]]
+                          ).update(pub_date=timezone.now())
+    return list(Recipe.objects.order_by('-pub_date', '-id').values_list(
+        'id', flat=True))
+
+
+def walk(client, url):
+    ids = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        assert 'count' not in response.data
+        ids += [recipe['id'] for recipe in response.data['results']]
+        url = response.data['next']
+    return ids
+
+
+def test_cursor_pages_follow_feed_order(client, recipes):
+    assert walk(client, '/api/recipes/?cursor=&limit=2') == recipes
+
+
+def test_cursor_pages_stable_after_new_recipe(client, recipes, make_recipe):
+    first = client.get('/api/recipes/?cursor=&limit=3')
+    make_recipe(name='Новый')
+    rest = walk(client, first.data['next'])
+    assert [recipe['id'] for recipe in first.data['results']] + rest == (
+        recipes)
+
+
+def test_cursor_round_trip(recipes):
+    recipe = Recipe.objects.get(id=recipes[3])
+    pagination = CustomPagination()
+    cursor = pagination.encode_cursor((recipe.pub_date, recipe.id))
+    assert pagination.decode_cursor(cursor) == (recipe.pub_date, recipe.id)
+
+
+def test_next_link_cursor_resumes_after_last_row(client, recipes):
+    response = client.get('/api/recipes/?cursor=&limit=3')
+    last = Recipe.objects.get(id=response.data['results'][-1]['id'])
+    cursor = parse_qs(urlparse(response.data['next']).query)['cursor'][0]
+    assert CustomPagination().decode_cursor(cursor) == (
+        last.pub_date, last.id)
+
+
+@pytest.mark.parametrize('cursor', ['garbage', 'bm9wZQ=='])
+def test_invalid_cursor(client, recipes, cursor):
+    response = client.get(f'/api/recipes/?cursor={cursor}')
+    assert response.status_code == 404
+
+
+def test_page_number_pagination_still_works(client, recipes):
+    response = client.get('/api/recipes/?page=2&limit=3')
+    assert response.status_code == 200
+    assert response.data['count'] == len(recipes)
+    assert [recipe['id'] for recipe in response.data['results']] == (
+        recipes[3:6])
+    assert parse_qs(urlparse(response.data['next']).query)['page'] == ['3']
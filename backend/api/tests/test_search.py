@@ -0,0 +1,45 @@
+import pytest
+from django.db import connection
+
+from foodgram_app.models import Recipe
+
+pytestmark = pytest.mark.skipif(
+    connection.vendor != 'sqlite', reason='FTS5 branch of the search')
+
+
+def search(client, query):
+    response = client.get('/api/recipes/', {'search': query})
+    assert response.status_code == 200
+    return [recipe['id'] for recipe in response.data['results']]
+
+
+def test_name_match_ranks_above_text_match(user_client, make_recipe):
+    in_text = make_recipe(name='Салат', text='Подавать с омлетом')
+    in_name = make_recipe(name='Омлет', text='Яйца и молоко')
+    make_recipe(name='Суп', text='Вода и овощи')
+    assert search(user_client, 'омлет') == [in_name.id, in_text.id]
+
+
+def test_words_match_as_prefixes(user_client, make_recipe):
+    recipe = make_recipe(name='Борщ украинский', text='Свёкла, капуста')
+    make_recipe(name='Борщ холодный', text='Кефир')
+    assert search(user_client, 'укр свёк') == [recipe.id]
+    assert search(user_client, 'БОРЩ укра') == [recipe.id]
+
+
+def test_updated_recipe_is_reindexed(user_client, make_recipe):
+    recipe = make_recipe(name='Блины', text='Мука')
+    recipe.name = 'Оладьи'
+    recipe.save()
+    assert search(user_client, 'блины') == []
+    assert search(user_client, 'оладьи') == [recipe.id]
+    Recipe.objects.filter(id=recipe.id).update(text='Кабачки')
+    assert search(user_client, 'кабач') == [recipe.id]
+    assert search(user_client, 'мука') == []
+
+
+def test_deleted_recipe_is_not_found(user_client, make_recipe):
+    recipe = make_recipe(name='Пирог', text='Яблоки')
+    recipe.delete()
+    assert search(user_client, 'пирог') == []
+
@@ -0,0 +1,79 @@
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+from api.similar import rebuild_similar_index
+from foodgram_app.models import RecipeBucket, RecipeSignature
+
+
+@pytest.fixture
+def image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (4, 4), 'white').save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()).decode()
+
+
+def similar(client, recipe_id):
+    response = client.get(f'/api/recipes/{recipe_id}/similar/')
+    assert response.status_code == 200
+    return {recipe['id']: recipe['similarity'] for recipe in response.data}
+
+
+def payload(ingredients, tag, image, name='Рецепт'):
+    return {
+        'ingredients': [{'id': ingredient.id, 'amount': 10}
+                        for ingredient in ingredients],
+        'tags': [tag.id], 'image': image, 'name': name,
+        'text': 'Описание', 'cooking_time': 10}
+
+
+def test_similar_ranks_by_shared_ingredients(client, make_recipe,
+                                             ingredients):
+    recipe = make_recipe(ingredients=ingredients[:4])
+    same = make_recipe(ingredients=ingredients[:4])
+    # Jaccard 0.8: a candidate in at least one band all but surely.
+    close = make_recipe(ingredients=ingredients[:5])
+    other = make_recipe(ingredients=ingredients[5:])
+    rebuild_similar_index()
+    scores = similar(client, recipe.id)
+    assert list(scores)[:2] == [same.id, close.id]
+    assert scores[same.id] == 1.0
+    assert scores[same.id] > scores[close.id]
+    assert recipe.id not in scores
+    assert other.id not in scores
+
+
+def test_similar_unknown_recipe(client, db):
+    assert client.get('/api/recipes/1000/similar/').status_code == 404
+
+
+def test_index_follows_recipe_changes(client, author_client, make_recipe,
+                                      ingredients, tag, image):
+    base = make_recipe(ingredients=ingredients[:4])
+    rebuild_similar_index()
+    response = author_client.post(
+        '/api/recipes/', payload(ingredients[:4], tag, image), format='json')
+    assert response.status_code == 201
+    created = response.data['id']
+    assert similar(client, base.id) == {created: 1.0}
+
+    response = author_client.patch(
+        f'/api/recipes/{created}/', payload(ingredients[4:], tag, image),
+        format='json')
+    assert response.status_code == 200
+    assert similar(client, base.id) == {}
+    assert similar(client, created) == {}
+
+    author_client.patch(
+        f'/api/recipes/{created}/', payload(ingredients[:4], tag, image),
+        format='json')
+    assert similar(client, base.id) == {created: 1.0}
+
+    assert author_client.delete(
+        f'/api/recipes/{created}/').status_code == 204
+    assert similar(client, base.id) == {}
+    assert not RecipeSignature.objects.filter(recipe_id=created).exists()
+    assert not RecipeBucket.objects.filter(recipe_id=created).exists()
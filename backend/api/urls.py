@@ -1,13 +1,19 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import (APIDownload, APIFavorite, APIFollow, APIFollowList,
-                    APIShopping, IngredientViewSet, RecipeViewSet, TagViewSet)
+from .views import (APIDownload, APIFavorite, APIFavoriteBatch, APIFeed,
+                    APIFollow, APIFollowBatch, APIFollowList, APIPantry,
+                    APIShopping, APIShoppingBatch, APIShoppingSummary,
+                    APISimilar, CustomUserViewSet,
+                    IngredientViewSet, RecipeViewSet, TagViewSet)
 
 router = DefaultRouter()
 router.register('tags', TagViewSet, basename='tags')
 router.register('recipes', RecipeViewSet, basename='recipes')
 router.register('ingredients', IngredientViewSet, basename='ingredients')
+# Registered after users/subscriptions/, which it would otherwise shadow.
+users_router = DefaultRouter()
+users_router.register('users', CustomUserViewSet)
 
 
 urlpatterns = [
@@ -15,6 +21,16 @@ urlpatterns = [
         r'recipes/download_shopping_cart/',
         APIDownload.as_view(),
         name='download_shopping_cart'),
+    path('recipes/feed/', APIFeed.as_view(), name='feed'),
+    path('recipes/pantry/', APIPantry.as_view(), name='pantry'),
+    path('recipes/favorite/', APIFavoriteBatch.as_view(),
+         name='favorite_batch'),
+    path('recipes/shopping_cart/', APIShoppingBatch.as_view(),
+         name='shopping_cart_batch'),
+    path('recipes/shopping_cart/summary/', APIShoppingSummary.as_view(),
+         name='shopping_cart_summary'),
+    path('users/subscribe/', APIFollowBatch.as_view(),
+         name='subscribe_batch'),
     path('', include(router.urls)),
     path(r'users/<int:pk>/subscribe/', APIFollow.as_view(), name='subscribe'),
     path(
@@ -25,7 +41,11 @@ urlpatterns = [
         r'recipes/<int:pk>/shopping_cart/',
         APIShopping.as_view(),
         name='shopping_cart'),
+    path(
+        r'recipes/<int:pk>/similar/',
+        APISimilar.as_view(),
+        name='similar'),
     path('users/subscriptions/', APIFollowList.as_view(), name='follow'),
-    path('', include('djoser.urls')),
+    path('', include(users_router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
 ]
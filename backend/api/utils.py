@@ -1,32 +1,237 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import (BooleanField, Count, Exists, F, OuterRef,
+                              Prefetch, Value, Window)
+from django.db.models.functions import RowNumber
 from django.shortcuts import get_object_or_404
-from rest_framework import status
+from rest_framework import serializers, status
 from rest_framework.response import Response
 
-from foodgram_app.models import Recipe, RecipeIngredient
+from foodgram_app.models import (Favorite, Follow, Purchase, Recipe,
+                                 RecipeIngredient)
+from users.models import CustomUser
+from .cache import bump_namespaces, user_namespace
+from .feed import follow_authors, unfollow_authors
+from .shopping_list import lock_recipes, lock_users
 
 
-def create(request, serializer, pk):
+# on_add/on_remove(user, recipe_ids) run in the same transaction after
+# the marks have been added or removed.
+def create(request, serializer, pk, counter, on_add=None):
     user = request.user
     recipe = get_object_or_404(Recipe, id=pk)
     serializer = serializer(data=request.data)
     serializer.is_valid(raise_exception=True)
-    serializer.save(user=user, recipe=recipe)
+    try:
+        with transaction.atomic():
+            serializer.save(user=user, recipe=recipe)
+            Recipe.objects.filter(id=recipe.id).update(
+                **{counter: F(counter) + 1})
+            if on_add is not None:
+                on_add(user, [recipe.id])
+    except IntegrityError:
+        raise serializers.ValidationError('Рецепт уже добавлен.')
     return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-def delete(request, model_name, pk):
+def delete(request, model_name, pk, counter, on_remove=None):
     user = request.user
     recipe = get_object_or_404(Recipe, id=pk)
     model = get_object_or_404(model_name, user=user, recipe=recipe)
-    if model:
-        model.delete()
+    with transaction.atomic():
+        deleted, _ = model_name.objects.filter(id=model.id).delete()
+        if deleted:
+            Recipe.objects.filter(id=recipe.id).update(
+                **{counter: F(counter) - 1})
+            if on_remove is not None:
+                on_remove(user, [recipe.id])
+    if deleted:
         return Response(status=status.HTTP_204_NO_CONTENT)
     return Response(status=status.HTTP_404_NOT_FOUND)
 
 
+# Batch variants of create()/delete(): a fixed number of statements in
+# one transaction whatever the number of ids, and a status per id.
+# bulk_create() sends no post_save, so the user's namespace is bumped
+# here. The recipes and then the user are locked before the marks are
+# read, so two identical batches sent at once run one after the other and
+# the second sees the marks of the first instead of counting them, or
+# adding their ingredients to the shopping list, again.
+def add_recipes(user, model, ids, counter, on_add=None):
+    with transaction.atomic():
+        found = set(lock_recipes(ids))
+        lock_users([user.id])
+        existing = set(model.objects.filter(
+            user=user, recipe_id__in=found).values_list(
+            'recipe_id', flat=True))
+        new = found - existing
+        if new:
+            model.objects.bulk_create(
+                (model(user=user, recipe_id=pk) for pk in new),
+                ignore_conflicts=True)
+            Recipe.objects.filter(id__in=new).update(
+                **{counter: F(counter) + 1})
+            if on_add is not None:
+                on_add(user, new)
+            namespace = user_namespace(user.id)
+            transaction.on_commit(lambda: bump_namespaces(namespace))
+    return {
+        pk: 'added' if pk in new else
+        'exists' if pk in existing else 'not_found'
+        for pk in ids}
+
+
+def remove_recipes(user, model, ids, counter, on_remove=None):
+    with transaction.atomic():
+        lock_recipes(ids)
+        lock_users([user.id])
+        marks = model.objects.filter(user=user, recipe_id__in=ids)
+        removed = set(marks.values_list('recipe_id', flat=True))
+        if removed:
+            marks.delete()
+            Recipe.objects.filter(id__in=removed).update(
+                **{counter: F(counter) - 1})
+            if on_remove is not None:
+                on_remove(user, removed)
+    return {pk: 'removed' if pk in removed else 'not_found' for pk in ids}
+
+
+def add_follows(user, ids):
+    with transaction.atomic():
+        found = set(CustomUser.objects.filter(id__in=ids).exclude(
+            id=user.id).values_list('id', flat=True))
+        existing = set(Follow.objects.filter(
+            user=user, author_id__in=found).values_list(
+            'author_id', flat=True))
+        new = found - existing
+        if new:
+            Follow.objects.bulk_create(
+                (Follow(user=user, author_id=pk) for pk in new),
+                ignore_conflicts=True)
+            follow_authors(user, new)
+            namespace = user_namespace(user.id)
+            transaction.on_commit(lambda: bump_namespaces(namespace))
+    return {
+        pk: 'added' if pk in new else
+        'exists' if pk in existing else
+        'self' if pk == user.id else 'not_found'
+        for pk in ids}
+
+
+def remove_follows(user, ids):
+    with transaction.atomic():
+        follows = Follow.objects.filter(user=user, author_id__in=ids)
+        removed = set(follows.values_list('author_id', flat=True))
+        if removed:
+            follows.delete()
+            unfollow_authors(user, removed)
+    return {pk: 'removed' if pk in removed else 'not_found' for pk in ids}
+
+
+def batch_response(statuses):
+    return Response({'results': [
+        {'id': pk, 'status': value} for pk, value in statuses.items()]})
+
+
 def ingredients_create(products, recipe):
-    for product in products:
-        RecipeIngredient.objects.create(
-            ingredient=product['id'],
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(
+            ingredient_id=product['id'],
             amount=product['amount'],
             recipe=recipe)
+        for product in products)
+
+
+# Returns how the amount of every ingredient has changed.
+def ingredients_update(products, recipe):
+    amounts = {product['id']: product['amount'] for product in products}
+    current = {
+        item.ingredient_id: item
+        for item in RecipeIngredient.objects.filter(recipe=recipe)}
+    deltas = {
+        ingredient_id: amount - current[ingredient_id].amount
+        if ingredient_id in current else amount
+        for ingredient_id, amount in amounts.items()}
+    removed = []
+    for ingredient_id, item in current.items():
+        if ingredient_id not in amounts:
+            removed.append(item.id)
+            deltas[ingredient_id] = -item.amount
+    if removed:
+        RecipeIngredient.objects.filter(id__in=removed).delete()
+    changed = []
+    for ingredient_id, item in current.items():
+        amount = amounts.get(ingredient_id)
+        if amount is not None and amount != item.amount:
+            item.amount = amount
+            changed.append(item)
+    if changed:
+        RecipeIngredient.objects.bulk_update(changed, ['amount'])
+    ingredients_create(
+        [product for product in products if product['id'] not in current],
+        recipe)
+    return deltas
+
+
+def annotate_subscribed(queryset, user):
+    if user.is_anonymous:
+        return queryset.annotate(
+            is_subscribed=Value(False, output_field=BooleanField()))
+    return queryset.annotate(is_subscribed=Exists(
+        Follow.objects.filter(user=user, author=OuterRef('pk'))))
+
+
+def recipes_for_user(user, queryset=None):
+    if queryset is None:
+        queryset = Recipe.objects.all()
+    queryset = queryset.prefetch_related(
+        Prefetch(
+            'author',
+            queryset=annotate_subscribed(CustomUser.objects.all(), user)),
+        'tags',
+        Prefetch(
+            'ingredients_amounts',
+            queryset=RecipeIngredient.objects.select_related('ingredient')))
+    if user.is_anonymous:
+        return queryset.annotate(
+            is_favorited=Value(False, output_field=BooleanField()),
+            is_in_shopping_cart=Value(False, output_field=BooleanField()))
+    return queryset.annotate(
+        is_favorited=Exists(
+            Favorite.objects.filter(user=user, recipe=OuterRef('pk'))),
+        is_in_shopping_cart=Exists(
+            Purchase.objects.filter(user=user, recipe=OuterRef('pk'))))
+
+
+def parse_limit(value):
+    if value is not None and value.isdigit():
+        return int(value)
+    return None
+
+
+def authors_for_user(user, queryset=None):
+    if queryset is None:
+        queryset = CustomUser.objects.all()
+    return annotate_subscribed(queryset, user).annotate(
+        recipes_count=Count('recipes'))
+
+
+def attach_short_recipes(authors, limit=None):
+    recipes = Recipe.objects.filter(author__in=[
+        author.id for author in authors])
+    if limit is not None:
+        ranked = recipes.order_by().annotate(recipe_rank=Window(
+            RowNumber(), partition_by=[F('author')],
+            order_by=[F('pub_date').desc(), F('id').desc()]))
+        sql, params = ranked.query.sql_with_params()
+        recipes = Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE ranked.recipe_rank <= %s '
+            'ORDER BY ranked.pub_date DESC, ranked.id DESC',
+            (*params, limit))
+    by_author = defaultdict(list)
+    for recipe in recipes:
+        by_author[recipe.author_id].append(recipe)
+    for author in authors:
+        author.short_recipes = by_author[author.id]
+    return authors
@@ -1,32 +1,77 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, status, viewsets
+from djoser.views import UserViewSet
+from rest_framework import serializers, status, viewsets
 from rest_framework.generics import ListAPIView
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny
+from rest_framework.settings import api_settings
 
 from foodgram_app.models import (Favorite, Follow, Ingredient, Purchase,
-                                 Recipe, RecipeIngredient, Tag)
+                                 Recipe, ShoppingListItem, Tag)
 from users.models import CustomUser
-from .filters import RecipeFilter, IngredientFilter
+from .cache import CachedReadMixin, recipe_namespace
+from .feed import follow_authors, unfollow_authors
+from .filters import RecipeFilter, RecipeSearchFilter
+from .ingredient_index import ingredient_index
+from .pagination import FeedPagination
+from .pantry import pantry_index
 from .permissions import RecipesPermission
-from .serializers import (FavoriteSerializer, FollowListSerializer,
-                          RecipeReadSerializer, RecipeWriteSerializer,
-                          ShoppingCartSerializer, TagSerializer,
-                          FollowWriteSerializer, IngredientSerializer)
-from .utils import create, delete
+from .recipe_cards import recipe_cards, recipe_rows
+from .serializers import (BatchSerializer, FavoriteSerializer,
+                          FollowListSerializer, PantryRecipeSerializer,
+                          PantrySerializer, RecipeReadSerializer,
+                          RecipeWriteSerializer, ShoppingCartSerializer,
+                          ShoppingListItemSerializer, SimilarRecipeSerializer,
+                          TagSerializer, FollowWriteSerializer,
+                          IngredientSerializer)
+from .shopping_list import (FORMATS, add_to_shopping_list,
+                            remove_from_shopping_list, shopping_list)
+from .similar import similar_recipes
+from .utils import (add_follows, add_recipes, annotate_subscribed,
+                    attach_short_recipes, authors_for_user, batch_response,
+                    create, delete, parse_limit, remove_follows,
+                    remove_recipes)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(CachedReadMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
-    filter_backends = (DjangoFilterBackend, filters.SearchFilter)
+    filter_backends = (DjangoFilterBackend, RecipeSearchFilter)
     # filterset_fields = ('author__id', )
-    search_fields = ('name', )
     filter_class = RecipeFilter
     permission_classes = [RecipesPermission, ]
+    cursor_pagination = True
+    replica_reads = True
+
+    def get_queryset(self):
+        if self.action in ('list', 'retrieve'):
+            return recipe_rows(self.request.user)
+        return super().get_queryset()
+
+    # Reads skip the serializer, see api/recipe_cards.py.
+    def list(self, request, *args, **kwargs):
+        return self.cached(self.list_cards, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(self.retrieve_card, request, *args, **kwargs)
+
+    def list_cards(self, request, *args, **kwargs):
+        page = self.paginate_queryset(
+            self.filter_queryset(self.get_queryset()))
+        return self.get_paginated_response(recipe_cards(page, request))
+
+    def retrieve_card(self, request, *args, **kwargs):
+        return Response(recipe_cards([self.get_object()], request)[0])
+
+    def get_cache_namespaces(self):
+        if self.action == 'retrieve':
+            return (recipe_namespace(self.kwargs['pk']), 'tags',
+                    'ingredients')
+        return ('recipe-list', 'tags', 'ingredients')
 
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
@@ -34,30 +79,49 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return RecipeWriteSerializer
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(CachedReadMixin, viewsets.ModelViewSet):
+    cache_namespaces = ('tags', )
+    replica_reads = True
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
     permission_classes = [AllowAny, ]
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(CachedReadMixin, viewsets.ModelViewSet):
+    cache_namespaces = ('ingredients', )
+    replica_reads = True
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (IngredientFilter, )
     permission_classes = [AllowAny, ]
-    search_fields = ('^name',)
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
+
+
+class CustomUserViewSet(UserViewSet):
+    # djoser's user list with is_subscribed computed in the same query.
+
+    def get_queryset(self):
+        return annotate_subscribed(
+            super().get_queryset(), self.request.user)
+
 
 class APIFollow(APIView):
     def post(self, request, pk=None):
         user = self.request.user
         author = get_object_or_404(CustomUser, id=self.kwargs['pk'])
         data = {'user': user.id, 'author': author.id}
-        serializer = FollowWriteSerializer(data=data)
+        serializer = FollowWriteSerializer(
+            data=data, context={'request': request})
         serializer.is_valid(raise_exception=True)
-        serializer.save(user=user, author=author)
+        with transaction.atomic():
+            serializer.save(user=user, author=author)
+            follow_authors(user, [author.id])
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, pk=None):
@@ -65,52 +129,186 @@ class APIFollow(APIView):
         author = get_object_or_404(CustomUser, id=self.kwargs['pk'])
         follow = get_object_or_404(Follow, user=user, author=author)
         if Follow.objects.filter(user=user, author=author).exists():
-            follow.delete()
+            with transaction.atomic():
+                follow.delete()
+                unfollow_authors(user, [author.id])
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_404_NOT_FOUND)
 
 
 class APIFollowList(ListAPIView):
     serializer_class = FollowListSerializer
+    replica_reads = True
 
     def get_queryset(self):
         user = self.request.user
-        queryset = CustomUser.objects.filter(following__user=user)
-        return queryset
+        return authors_for_user(
+            user, CustomUser.objects.filter(following__user=user)
+        ).order_by('id')
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            attach_short_recipes(page, parse_limit(
+                self.request.query_params.get('recipes_limit')))
+        return page
+
+
+class APIFeed(ListAPIView):
+    pagination_class = FeedPagination
+    replica_reads = True
+
+    def get_queryset(self):
+        return recipe_rows(self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        return self.get_paginated_response(recipe_cards(page, request))
+
+
+class APISimilar(ListAPIView):
+    serializer_class = SimilarRecipeSerializer
+    pagination_class = None
+    permission_classes = [AllowAny, ]
+    replica_reads = True
+
+    def get_queryset(self):
+        recipe = get_object_or_404(Recipe, id=self.kwargs['pk'])
+        limit = min(
+            parse_limit(self.request.query_params.get('limit'))
+            or api_settings.PAGE_SIZE, settings.MAX_PAGE_SIZE)
+        scores = similar_recipes(recipe.id, limit)
+        recipes = Recipe.objects.in_bulk(scores)
+        similar = []
+        for pk, score in scores.items():
+            if pk in recipes:
+                recipes[pk].similarity = score
+                similar.append(recipes[pk])
+        return similar
+
+
+# ?ingredients=1&ingredients=2&missing=1: recipes that can be cooked from
+# these ingredients buying at most missing more, best covered first.
+class APIPantry(ListAPIView):
+    serializer_class = PantryRecipeSerializer
+    pagination_class = None
+    permission_classes = [AllowAny, ]
+    replica_reads = True
+
+    def get_queryset(self):
+        params = self.request.query_params
+        query = PantrySerializer(data={
+            'ingredients': params.getlist('ingredients'),
+            **({'missing': params['missing']} if 'missing' in params
+               else {})})
+        query.is_valid(raise_exception=True)
+        limit = min(parse_limit(params.get('limit'))
+                    or api_settings.PAGE_SIZE, settings.MAX_PAGE_SIZE)
+        found = pantry_index.search(
+            query.validated_data['ingredients'],
+            query.validated_data['missing'], limit)
+        recipes = Recipe.objects.in_bulk([pk for pk, _, _ in found])
+        matches = []
+        for pk, coverage, missing in found:
+            if pk in recipes:
+                recipes[pk].coverage = coverage
+                recipes[pk].missing = missing
+                matches.append(recipes[pk])
+        return matches
 
 
 class APIFavorite(APIView):
     def post(self, request, pk=None):
-        return create(request, FavoriteSerializer, self.kwargs['pk'])
+        return create(request, FavoriteSerializer, self.kwargs['pk'],
+                      'favorites_count')
 
     def delete(self, request, pk=None):
-        return delete(request, Favorite, self.kwargs['pk'])
+        return delete(request, Favorite, self.kwargs['pk'],
+                      'favorites_count')
 
 
 class APIShopping(APIView):
     def post(self, request, pk=None):
-        return create(request, ShoppingCartSerializer, self.kwargs['pk'])
+        return create(request, ShoppingCartSerializer, self.kwargs['pk'],
+                      'purchases_count', add_to_shopping_list)
 
     def delete(self, request, pk=None):
-        return delete(request, Purchase, self.kwargs['pk'])
+        return delete(request, Purchase, self.kwargs['pk'],
+                      'purchases_count', remove_from_shopping_list)
+
+
+class APIBatch(APIView):
+    # {"ids": [...]}: POST adds the items, DELETE removes them.
+
+    def get_ids(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['ids']
+
+
+class APIRecipesBatch(APIBatch):
+    model = None
+    counter = None
+    on_add = None
+    on_remove = None
+
+    def post(self, request):
+        return batch_response(add_recipes(
+            request.user, self.model, self.get_ids(request), self.counter,
+            self.on_add))
+
+    def delete(self, request):
+        return batch_response(remove_recipes(
+            request.user, self.model, self.get_ids(request), self.counter,
+            self.on_remove))
+
+
+class APIFavoriteBatch(APIRecipesBatch):
+    model = Favorite
+    counter = 'favorites_count'
+
+
+class APIShoppingBatch(APIRecipesBatch):
+    model = Purchase
+    counter = 'purchases_count'
+    on_add = staticmethod(add_to_shopping_list)
+    on_remove = staticmethod(remove_from_shopping_list)
+
+
+class APIShoppingSummary(ListAPIView):
+    serializer_class = ShoppingListItemSerializer
+    pagination_class = None
+
+    def get_queryset(self):
+        return ShoppingListItem.objects.filter(
+            user=self.request.user).select_related('ingredient').order_by(
+            'ingredient__name', 'ingredient__measurement_unit')
+
+
+class APIFollowBatch(APIBatch):
+
+    def post(self, request):
+        return batch_response(
+            add_follows(request.user, self.get_ids(request)))
+
+    def delete(self, request):
+        return batch_response(
+            remove_follows(request.user, self.get_ids(request)))
 
 
 class APIDownload(APIView):
+    # ?format= selects the file type here, not a DRF renderer.
+    def perform_content_negotiation(self, request, force=False):
+        return super().perform_content_negotiation(request, force=True)
+
     def get(self, request):
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__purchased_by__user=request.user).values(
-                'ingredient__name',
-                'ingredient__measurement_unit').annotate(
-                quantity=Sum('amount'))
-        ingredient_strings = []
-        for elem in ingredients:
-            ingredient_strings.append(
-                f'{elem["ingredient__name"]} '
-                f'({elem["ingredient__measurement_unit"]}) — '
-                f'{elem["quantity"]}')
-        text = '\n'.join(ingredient_strings)
-        response = HttpResponse(
-            text, content_type='text/plain')
+        file_format = request.query_params.get('format', 'txt')
+        if file_format not in FORMATS:
+            raise serializers.ValidationError(
+                {'format': f'Доступные форматы: {", ".join(FORMATS)}.'})
+        content_type, writer = FORMATS[file_format]
+        response = StreamingHttpResponse(
+            writer(shopping_list(request.user)), content_type=content_type)
         response['Content-Disposition'] =\
-            'attachment; filename="Список Покупок.txt"'
+            f'attachment; filename="Список Покупок.{file_format}"'
         return response
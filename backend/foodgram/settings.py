@@ -1,4 +1,6 @@
 import os
+import sys
+import tempfile
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -20,8 +22,8 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'users',
-    'api',
-    'foodgram_app',
+    'api.apps.ApiConfig',
+    'foodgram_app.apps.FoodgramAppConfig',
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
@@ -31,11 +33,14 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'users.CustomUser'
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'api.nplusone.QueryRepeatMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.replicas.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -80,6 +85,40 @@ else:
         }
     }
 
+# Comma separated replica hosts (file names for SQLite). Tests read from
+# the primary through TEST MIRROR.
+DATABASE_REPLICAS = []
+for index, replica in enumerate(filter(None, os.getenv(
+        'DB_REPLICAS', default='').split(','))):
+    location = ('NAME' if DATABASES['default']['ENGINE'].endswith('sqlite3')
+                else 'HOST')
+    DATABASES[f'replica{index}'] = {
+        **DATABASES['default'], location: replica.strip(),
+        'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{index}')
+
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+
+REPLICA_STICKY_SECONDS = int(
+    os.getenv('REPLICA_STICKY_SECONDS', default=10))
+
+# Local memory by default; point CACHE_BACKEND at a shared backend
+# (file based, memcached or django_redis.cache.RedisCache) so that
+# invalidation reaches every gunicorn worker.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+
+TOKEN_CACHE_TIMEOUT = int(os.getenv('TOKEN_CACHE_TIMEOUT', default=60))
+
+RESPONSE_CACHE_TIMEOUT = int(
+    os.getenv('RESPONSE_CACHE_TIMEOUT', default=300))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -97,7 +136,7 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated', ),
@@ -117,6 +156,66 @@ DJOSER = {
     'HIDE_USERS': False
 }
 
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', default=100))
+
+PAGINATION_COUNT_TIMEOUT = int(
+    os.getenv('PAGINATION_COUNT_TIMEOUT', default=60))
+
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', default=100))
+
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', default=10000))
+
+FEED_FANOUT_BATCH_SIZE = int(
+    os.getenv('FEED_FANOUT_BATCH_SIZE', default=1000))
+
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', default=100))
+
+FEED_WORKERS = int(os.getenv('FEED_WORKERS', default=2))
+
+INGREDIENT_SEARCH_LIMIT = int(
+    os.getenv('INGREDIENT_SEARCH_LIMIT', default=50))
+
+INGREDIENT_INDEX_MAX_AGE = int(
+    os.getenv('INGREDIENT_INDEX_MAX_AGE', default=300))
+
+PANTRY_INDEX_MAX_AGE = int(os.getenv('PANTRY_INDEX_MAX_AGE', default=300))
+
+PANTRY_LOG_SIZE = int(os.getenv('PANTRY_LOG_SIZE', default=10000))
+
+# Only gunicorn workers share their metrics through METRICS_DIR; see
+# gunicorn.conf.py.
+METRICS_SHARED = os.getenv('METRICS_SHARED') == '1'
+
+METRICS_DIR = os.getenv(
+    'METRICS_DIR',
+    default=os.path.join(tempfile.gettempdir(), 'foodgram-metrics'))
+
+METRICS_FLUSH_INTERVAL = float(
+    os.getenv('METRICS_FLUSH_INTERVAL', default=1))
+
+QUERY_REPEAT_MODE = os.getenv(
+    'QUERY_REPEAT_MODE', default='raise' if 'pytest' in sys.modules else 'log')
+
+QUERY_REPEAT_THRESHOLD = int(os.getenv('QUERY_REPEAT_THRESHOLD', default=5))
+
+QUERY_REPEAT_SAMPLE_RATE = float(
+    os.getenv('QUERY_REPEAT_SAMPLE_RATE', default=0.01))
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
+IMAGE_UPLOAD_MAX_SIZE = int(
+    os.getenv('IMAGE_UPLOAD_MAX_SIZE', default=10 * 1024 * 1024))
+
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default=2))
+
+IMAGE_WEBP_QUALITY = 80
+
+IMAGE_MAX_SIZE = (1600, 1600)
+
+IMAGE_THUMBNAIL_SIZE = (480, 480)
+
 
 LANGUAGE_CODE = 'en-us'
 
@@ -133,3 +232,8 @@ STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static/')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
+
+# Ingredient and tag files for load_data and check_api_budget; the
+# repository's data/ next to backend/, mounted as /data in docker-compose.
+DATA_DIR = os.getenv(
+    'DATA_DIR', default=os.path.join(os.path.dirname(BASE_DIR), 'data'))
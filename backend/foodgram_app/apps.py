@@ -1,5 +1,10 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class FoodgramAppConfig(AppConfig):
     name = 'foodgram_app'
+
+    def ready(self):
+        from .search import restore_sqlite_triggers
+        post_migrate.connect(restore_sqlite_triggers, sender=self)
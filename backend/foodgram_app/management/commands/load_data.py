@@ -0,0 +1,118 @@
+import csv
+import itertools
+import json
+import os
+import re
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.ingredient_index import ingredient_index
+from foodgram_app.models import Ingredient, Tag
+
+CHUNK_SIZE = 64 * 1024
+SEPARATORS = re.compile(r'[\s,]*')
+
+
+def read_csv(file, fields):
+    for row in csv.reader(file):
+        if row:
+            yield dict(zip(fields, (value.strip() for value in row)))
+
+
+def read_json(file):
+    decoder = json.JSONDecoder()
+    buffer = file.read(CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('JSON-файл должен содержать массив объектов.')
+    position = 1
+    while True:
+        position = SEPARATORS.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                raise CommandError('JSON-файл обрывается на середине.')
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+
+
+def read(path, fields):
+    try:
+        file = open(path, encoding='utf-8')
+    except FileNotFoundError:
+        raise CommandError(
+            f'Файл {path} не найден; укажите его явно или задайте '
+            'каталог с данными в DATA_DIR.')
+    with file:
+        if path.endswith('.json'):
+            yield from read_json(file)
+        else:
+            yield from read_csv(file, fields)
+
+
+class Command(BaseCommand):
+    help = ('Загружает ингредиенты и теги из CSV или JSON. Повторный '
+            'запуск не создаёт дубликатов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ingredients',
+            default=os.path.join(settings.DATA_DIR, 'ingredients.csv'),
+            help='CSV (name,measurement_unit) или JSON-массив объектов.')
+        parser.add_argument(
+            '--tags', default=os.path.join(settings.DATA_DIR, 'tags.csv'),
+            help='CSV (name,color,slug) или JSON-массив объектов.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.verbosity = options['verbosity']
+        if options['ingredients']:
+            self.load(
+                Ingredient, options['ingredients'],
+                ('name', 'measurement_unit'),
+                ('name', 'measurement_unit'))
+            ingredient_index.invalidate()
+        if options['tags']:
+            self.load(Tag, options['tags'], ('name', 'color', 'slug'),
+                      ('slug', ))
+
+    def load(self, model, path, fields, key_fields):
+        name = model._meta.verbose_name_plural
+        processed = 0
+        # bulk_create(ignore_conflicts=True) does not say which rows it
+        # skipped, so the added ones are counted by the table size.
+        before = model.objects.count()
+        items = read(path, fields)
+        while True:
+            batch = list(itertools.islice(items, self.batch_size))
+            if not batch:
+                break
+            processed += len(batch)
+            unique = {}
+            for item in batch:
+                try:
+                    values = {field: item[field] for field in fields}
+                except KeyError as error:
+                    raise CommandError(
+                        f'{path}: у записи {item} нет поля {error}.')
+                unique[tuple(values[field] for field in key_fields)] = values
+            existing = set(model.objects.filter(**{
+                f'{key_fields[0]}__in': {key[0] for key in unique}
+            }).values_list(*key_fields))
+            new = [model(**values) for key, values in unique.items()
+                   if key not in existing]
+            model.objects.bulk_create(new, ignore_conflicts=True)
+            if self.verbosity > 1:
+                created = model.objects.count() - before
+                self.stdout.write(
+                    f'{name}: обработано {processed}, добавлено {created}')
+        created = model.objects.count() - before
+        self.stdout.write(self.style.SUCCESS(
+            f'{name}: обработано {processed}, добавлено {created}.'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from foodgram_app.models import Favorite, Purchase, Recipe
+
+COUNTERS = (
+    ('favorites_count', Favorite),
+    ('purchases_count', Purchase),
+)
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики избранного и покупок у рецептов и '
+            'исправляет расхождения.')
+
+    def handle(self, *args, **options):
+        for field, model in COUNTERS:
+            actual = Coalesce(Subquery(
+                model.objects.filter(recipe=OuterRef('pk')).order_by(
+                ).values('recipe').annotate(total=Count('id')).values(
+                    'total')), 0)
+            fixed = Recipe.objects.exclude(**{field: actual}).update(
+                **{field: actual})
+            self.stdout.write(f'{field}: исправлено рецептов: {fixed}')
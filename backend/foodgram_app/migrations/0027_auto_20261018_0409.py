@@ -0,0 +1,55 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:09
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+# Keeps the oldest of the ingredients with the same name and unit and
+# moves the recipes of the others to it; a recipe that ends up with the
+# survivor twice gets one row with the amounts added up. The shopping
+# list (ShoppingListItem) is created in 0033 from the merged rows, so it
+# has nothing to repoint yet.
+def merge_duplicates(apps, schema_editor):
+    Ingredient = apps.get_model('foodgram_app', 'Ingredient')
+    RecipeIngredient = apps.get_model('foodgram_app', 'RecipeIngredient')
+    groups = Ingredient.objects.values('name', 'measurement_unit').annotate(
+        keep=Min('id'), total=Count('id')).filter(total__gt=1)
+    survivors = []
+    for group in groups:
+        duplicates = Ingredient.objects.filter(
+            name=group['name'],
+            measurement_unit=group['measurement_unit']).exclude(
+            id=group['keep'])
+        RecipeIngredient.objects.filter(ingredient__in=duplicates).update(
+            ingredient_id=group['keep'])
+        duplicates.delete()
+        survivors.append(group['keep'])
+    pairs = RecipeIngredient.objects.filter(
+        ingredient__in=survivors).values('recipe', 'ingredient').annotate(
+        keep=Min('id'), amount=Sum('amount'), total=Count('id')).filter(
+        total__gt=1)
+    for pair in pairs:
+        RecipeIngredient.objects.filter(id=pair['keep']).update(
+            amount=pair['amount'])
+        RecipeIngredient.objects.filter(
+            recipe=pair['recipe'], ingredient=pair['ingredient']).exclude(
+            id=pair['keep']).delete()
+    if schema_editor.connection.vendor == 'postgresql':
+        # The foreign keys are checked at commit; ALTER TABLE below runs in
+        # the same transaction and refuses to with checks still pending.
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram_app', '0026_auto_20220122_1432'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
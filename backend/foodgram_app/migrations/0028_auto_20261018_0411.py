@@ -0,0 +1,36 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:11
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('foodgram_app', 'Recipe')
+    for field, model_name in (('favorites_count', 'Favorite'),
+                              ('purchases_count', 'Purchase')):
+        model = apps.get_model('foodgram_app', model_name)
+        counts = model.objects.filter(recipe=OuterRef('pk')).order_by(
+            ).values('recipe').annotate(total=Count('id')).values('total')
+        Recipe.objects.update(**{field: Coalesce(Subquery(counts), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram_app', '0027_auto_20261018_0409'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Favorites count'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='purchases_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Purchases count'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
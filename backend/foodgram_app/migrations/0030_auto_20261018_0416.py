@@ -0,0 +1,17 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:16
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram_app', '0029_auto_20261018_0414'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='recipe',
+            options={'ordering': ('-pub_date', '-id'), 'verbose_name': 'Recipe', 'verbose_name_plural': 'Recipes'},
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from foodgram_app.search import install, uninstall
+
+
+def create_search_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        install(cursor, schema_editor.connection.vendor)
+
+
+def drop_search_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        uninstall(cursor, schema_editor.connection.vendor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram_app', '0031_auto_20261018_0419'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
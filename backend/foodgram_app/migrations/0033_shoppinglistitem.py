@@ -0,0 +1,48 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:33
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_lists(apps, schema_editor):
+    RecipeIngredient = apps.get_model('foodgram_app', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('foodgram_app', 'ShoppingListItem')
+    totals = RecipeIngredient.objects.filter(
+        recipe__purchased_by__isnull=False).values(
+        'recipe__purchased_by__user', 'ingredient').annotate(
+        total=models.Sum('amount')).order_by()
+    ShoppingListItem.objects.bulk_create(
+        (ShoppingListItem(user_id=item['recipe__purchased_by__user'],
+                          ingredient_id=item['ingredient'],
+                          quantity=item['total'])
+         for item in totals.iterator()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('foodgram_app', '0032_recipe_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Quantity')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='foodgram_app.Ingredient', verbose_name='ShoppingListIngredient')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='ShoppingListUser')),
+            ],
+            options={
+                'verbose_name': 'ShoppingListItem',
+                'verbose_name_plural': 'ShoppingListItems',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_list_item'),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
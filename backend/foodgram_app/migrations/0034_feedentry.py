@@ -0,0 +1,61 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:36
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_feeds(apps, schema_editor):
+    Follow = apps.get_model('foodgram_app', 'Follow')
+    Recipe = apps.get_model('foodgram_app', 'Recipe')
+    FeedEntry = apps.get_model('foodgram_app', 'FeedEntry')
+    followers = defaultdict(list)
+    for user_id, author_id in Follow.objects.values_list(
+            'user_id', 'author_id').iterator():
+        followers[author_id].append(user_id)
+    for author_id, users in followers.items():
+        if len(users) > settings.FEED_FANOUT_LIMIT:
+            continue
+        recipes = Recipe.objects.filter(author_id=author_id).order_by(
+            '-pub_date', '-id').values_list('id', 'pub_date')
+        FeedEntry.objects.bulk_create(
+            (FeedEntry(user_id=user_id, author_id=author_id,
+                       recipe_id=recipe_id, pub_date=pub_date)
+             for recipe_id, pub_date in recipes[:settings.FEED_BACKFILL_SIZE]
+             for user_id in users), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('foodgram_app', '0033_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Pub_date')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='FeedAuthor')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='foodgram_app.Recipe', verbose_name='FeedRecipe')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='feed', to=settings.AUTH_USER_MODEL, verbose_name='FeedUser')),
+            ],
+            options={
+                'verbose_name': 'FeedEntry',
+                'verbose_name_plural': 'FeedEntries',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', '-pub_date', '-recipe'], name='feed_timeline_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_feed_entry'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram_app', '0034_feedentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSignature',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='foodgram_app.Recipe', verbose_name='SignatureRecipe')),
+                ('signature', models.BinaryField(verbose_name='MinHash signature')),
+            ],
+            options={
+                'verbose_name': 'RecipeSignature',
+                'verbose_name_plural': 'RecipeSignatures',
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.PositiveSmallIntegerField(verbose_name='Band')),
+                ('bucket', models.BigIntegerField(verbose_name='Bucket')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='foodgram_app.Recipe', verbose_name='BucketRecipe')),
+            ],
+            options={
+                'verbose_name': 'RecipeBucket',
+                'verbose_name_plural': 'RecipeBuckets',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipebucket',
+            index=models.Index(fields=['band', 'bucket', 'recipe'], name='recipe_bucket_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram_app', '0035_similar_recipes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('recipe_id', models.PositiveIntegerField(verbose_name='Recipe id')),
+            ],
+            options={
+                'verbose_name': 'RecipeChange',
+                'verbose_name_plural': 'RecipeChanges',
+            },
+        ),
+    ]
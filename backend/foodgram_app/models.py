@@ -28,6 +28,9 @@ class Ingredient(models.Model):
         max_length=10, verbose_name='Measurement_unit')
 
     class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('name', 'measurement_unit'),
+                                    name='unique_ingredient')]
         verbose_name = 'Ingredient'
         verbose_name_plural = 'Ingredients'
 
@@ -40,6 +43,7 @@ class Recipe(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='recipes',
+        db_index=False,
         verbose_name='Author')
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -51,16 +55,29 @@ class Recipe(models.Model):
         related_name='recipes',
         verbose_name='Tags')
     image = models.ImageField(verbose_name='Image')
+    image_webp = models.ImageField(
+        blank=True, editable=False, verbose_name='Image (WebP)')
+    image_thumbnail = models.ImageField(
+        blank=True, editable=False, verbose_name='Thumbnail')
     name = models.CharField(max_length=200, verbose_name='Name')
     text = models.TextField(max_length=256, verbose_name='Text')
     cooking_time = models.IntegerField(verbose_name='Cooking time')
+    # No index of its own: recipe_feed_idx starts with it.
     pub_date = models.DateTimeField(
-        auto_now_add=True,
-        db_index=True, verbose_name='Pub_date'
+        auto_now_add=True, verbose_name='Pub_date'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Favorites count')
+    purchases_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Purchases count')
 
     class Meta:
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
+        indexes = [
+            models.Index(fields=('-pub_date', '-id'),
+                         name='recipe_feed_idx'),
+            models.Index(fields=('author', '-pub_date', '-id'),
+                         name='recipe_author_feed_idx')]
         verbose_name = 'Recipe'
         verbose_name_plural = 'Recipes'
 
@@ -77,6 +94,7 @@ class RecipeIngredient(models.Model):
         Recipe,
         on_delete=models.CASCADE,
         related_name='ingredients_amounts',
+        db_index=False,
         verbose_name='RecipeForIngredient'
     )
     amount = models.IntegerField(
@@ -84,6 +102,9 @@ class RecipeIngredient(models.Model):
     )
 
     class Meta:
+        indexes = [
+            models.Index(fields=('recipe', 'ingredient'),
+                         name='recipe_ingredient_idx')]
         verbose_name = 'RecipeIngredient'
         verbose_name_plural = 'RecipeIngredients'
 
@@ -98,12 +119,16 @@ class Follow(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='following',
+        db_index=False,
         verbose_name='Following')
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=('user', 'author'),
                                     name='unique_follow')]
+        indexes = [
+            models.Index(fields=('author', 'user'),
+                         name='follow_author_user_idx')]
         verbose_name = 'Subscription'
         verbose_name_plural = 'Subscriptions'
 
@@ -118,12 +143,16 @@ class Favorite(models.Model):
         Recipe,
         on_delete=models.CASCADE,
         related_name='favored_by',
+        db_index=False,
         verbose_name='FavoriteRecipe')
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=('user', 'recipe'),
                                     name='unique_favorite_list')]
+        indexes = [
+            models.Index(fields=('recipe', 'user'),
+                         name='favorite_recipe_user_idx')]
         verbose_name = 'Favorite'
         verbose_name_plural = 'Favorites'
 
@@ -138,11 +167,110 @@ class Purchase(models.Model):
         Recipe,
         on_delete=models.CASCADE,
         related_name='purchased_by',
+        db_index=False,
         verbose_name='RecipePurchase')
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=('user', 'recipe'),
                                     name='unique_purchase_list')]
+        indexes = [
+            models.Index(fields=('recipe', 'user'),
+                         name='purchase_recipe_user_idx')]
         verbose_name = 'Purchase'
         verbose_name_plural = 'Purchases'
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        db_index=False,
+        verbose_name='ShoppingListUser')
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='ShoppingListIngredient')
+    quantity = models.PositiveIntegerField(verbose_name='Quantity')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('user', 'ingredient'),
+                                    name='unique_shopping_list_item')]
+        verbose_name = 'ShoppingListItem'
+        verbose_name_plural = 'ShoppingListItems'
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        db_index=False,
+        verbose_name='FeedUser')
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='FeedAuthor')
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='FeedRecipe')
+    pub_date = models.DateTimeField(verbose_name='Pub_date')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('user', 'recipe'),
+                                    name='unique_feed_entry')]
+        indexes = [
+            models.Index(fields=('user', '-pub_date', '-recipe'),
+                         name='feed_timeline_idx')]
+        verbose_name = 'FeedEntry'
+        verbose_name_plural = 'FeedEntries'
+
+
+class RecipeSignature(models.Model):
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+',
+        verbose_name='SignatureRecipe')
+    signature = models.BinaryField(verbose_name='MinHash signature')
+
+    class Meta:
+        verbose_name = 'RecipeSignature'
+        verbose_name_plural = 'RecipeSignatures'
+
+
+class RecipeBucket(models.Model):
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='BucketRecipe')
+    band = models.PositiveSmallIntegerField(verbose_name='Band')
+    bucket = models.BigIntegerField(verbose_name='Bucket')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=('band', 'bucket', 'recipe'),
+                         name='recipe_bucket_idx')]
+        verbose_name = 'RecipeBucket'
+        verbose_name_plural = 'RecipeBuckets'
+
+
+class RecipeChange(models.Model):
+    # Log of recipes whose ingredients changed, read by the in-memory
+    # indexes of the API workers; a plain id because it outlives the
+    # recipe.
+    id = models.BigAutoField(primary_key=True)
+    recipe_id = models.PositiveIntegerField(verbose_name='Recipe id')
+
+    class Meta:
+        verbose_name = 'RecipeChange'
+        verbose_name_plural = 'RecipeChanges'
@@ -0,0 +1,105 @@
+from django.db import connections
+
+RECIPE_TABLE = 'foodgram_app_recipe'
+SEARCH_TABLE = 'foodgram_app_recipe_search'
+SEARCH_CONFIG = 'russian'
+
+# PostgreSQL keeps a weighted tsvector of name and text in the recipe
+# row itself; a trigger refreshes it on every insert and update.
+POSTGRES = (
+    f'ALTER TABLE {RECIPE_TABLE} ADD COLUMN search_vector tsvector',
+    f'''CREATE FUNCTION {SEARCH_TABLE}_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('{SEARCH_CONFIG}',
+                                  coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('{SEARCH_CONFIG}',
+                                  coalesce(NEW.text, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql''',
+    f'''CREATE TRIGGER {SEARCH_TABLE}_update
+    BEFORE INSERT OR UPDATE OF name, text ON {RECIPE_TABLE}
+    FOR EACH ROW EXECUTE PROCEDURE {SEARCH_TABLE}_update()''',
+    f'UPDATE {RECIPE_TABLE} SET name = name',
+    f'''CREATE INDEX {SEARCH_TABLE}_idx ON {RECIPE_TABLE}
+    USING GIN (search_vector)''',
+)
+POSTGRES_REVERSE = (
+    f'DROP TRIGGER {SEARCH_TABLE}_update ON {RECIPE_TABLE}',
+    f'DROP FUNCTION {SEARCH_TABLE}_update()',
+    f'ALTER TABLE {RECIPE_TABLE} DROP COLUMN search_vector',
+)
+
+# SQLite uses an external-content FTS5 table over the recipe table.
+SQLITE = (
+    f'''CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        name, text, content='{RECIPE_TABLE}', content_rowid='id')''',
+)
+SQLITE_TRIGGERS = (
+    f'''CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_insert
+    AFTER INSERT ON {RECIPE_TABLE} BEGIN
+        INSERT INTO {SEARCH_TABLE} (rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_delete
+    AFTER DELETE ON {RECIPE_TABLE} BEGIN
+        INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_update
+    AFTER UPDATE OF name, text ON {RECIPE_TABLE} BEGIN
+        INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO {SEARCH_TABLE} (rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END''',
+)
+SQLITE_REBUILD = (
+    f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('rebuild')",
+)
+SQLITE_REVERSE = (
+    f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_update',
+    f'DROP TABLE IF EXISTS {SEARCH_TABLE}',
+)
+
+
+def execute(cursor, statements):
+    for statement in statements:
+        cursor.execute(statement)
+
+
+def install(cursor, vendor):
+    if vendor == 'postgresql':
+        execute(cursor, POSTGRES)
+    elif vendor == 'sqlite':
+        execute(cursor, SQLITE + SQLITE_TRIGGERS + SQLITE_REBUILD)
+
+
+def uninstall(cursor, vendor):
+    if vendor == 'postgresql':
+        execute(cursor, POSTGRES_REVERSE)
+    elif vendor == 'sqlite':
+        execute(cursor, SQLITE_REVERSE)
+
+
+# SQLite rebuilds a table from scratch whenever a migration alters it,
+# which silently drops its triggers; put them back and reindex.
+def restore_sqlite_triggers(using='default', **kwargs):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' "
+            "AND name IN (%s, %s)", (RECIPE_TABLE, SEARCH_TABLE))
+        if len(cursor.fetchall()) < 2:
+            return
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' "
+            "AND tbl_name = %s AND name LIKE %s",
+            (RECIPE_TABLE, f'{SEARCH_TABLE}%'))
+        if cursor.fetchone()[0] < len(SQLITE_TRIGGERS):
+            execute(cursor, SQLITE_TRIGGERS + SQLITE_REBUILD)
@@ -0,0 +1,26 @@
+import multiprocessing
+import os
+import shutil
+
+# Threaded workers: a request waiting on the database blocks one thread
+# instead of a whole worker process. Django keeps one DB connection per
+# thread, so the database has to accept workers * threads connections.
+bind = os.getenv('GUNICORN_BIND', default='0:8000')
+workers = int(os.getenv(
+    'GUNICORN_WORKERS', default=multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', default='gthread')
+threads = int(os.getenv('GUNICORN_THREADS', default=8))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', default=30))
+keepalive = 5
+
+# Workers write their metrics to METRICS_DIR for /metrics to add up;
+# manage.py and runserver keep theirs in memory. Set before the settings
+# are imported, which happens in on_starting.
+os.environ['METRICS_SHARED'] = '1'
+
+
+def on_starting(server):
+    # Metrics files of the previous run would be added to the new totals.
+    from foodgram.settings import METRICS_DIR
+
+    shutil.rmtree(METRICS_DIR, ignore_errors=True)
@@ -5,11 +5,10 @@ from .models import CustomUser
 
 
 class RecipesAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'favorites_count')
+    list_display = ('name', 'author', 'favorites_count', 'purchases_count')
     list_filter = ('name', 'author', 'tags')
-
-    def favorites_count(self, obj):
-        return models.Favorite.objects.filter(recipe=obj).count()
+    list_select_related = ('author', )
+    readonly_fields = ('favorites_count', 'purchases_count')
 
 
 class UserAdmin(admin.ModelAdmin):